@@ -1,44 +1,47 @@
+import asyncio
 import json
+import logging
 import re
+import uuid
 from datetime import datetime
-from difflib import get_close_matches
-from langchain.memory import ConversationBufferWindowMemory
-from langchain_groq import ChatGroq
 from langchain.prompts import PromptTemplate
-from models import Restaurant, MenuItem, CartItem, UserProfile, KnowledgeGraph
-from tools import LocationNormalizerTool, RestaurantSearchTool, MenuTool
+from models import Restaurant, MenuItem, UserProfile, KnowledgeGraph
+from cart import Cart
+from memory import ConversationMemory
+from menu import Menu, format_menu, parse_menu
+from metrics import FALLBACKS, record_llm_usage, record_prompt, span, timed_turn
+from order_parser import ParsedOrder, parse_order
+from tools import (LocationNormalizerTool, RestaurantSearchTool, MenuTool, MENU_UNAVAILABLE, PLACE_SEPARATORS,
+                   menu_prefetcher, split_choices)
 from utils import normalize
-from prompts import CART_EXTRACTION_PROMPT, GROQ_API_KEY, http_client
-from typing import List, Optional
+from prompts import CART_EXTRACTION_PROMPT, MEMORY_PROMPT_TOKENS, MENU_PREFETCH_COUNT, get_llm
+from typing import AsyncIterator, List, Optional, Tuple
 
 
+logger = logging.getLogger(__name__)
+
 
 class FoodOrderingAgent:
-    def __init__(self):
-        self.llm = ChatGroq(
-            temperature=0.1,
-            groq_api_key=GROQ_API_KEY,
-            model_name="llama3-8b-8192",
-            http_client=http_client
-        )
+    def __init__(self, knowledge_graph: Optional[KnowledgeGraph] = None, user_id: str = "user_001"):
+        self.llm = get_llm(temperature=0.1)
         
-        self.knowledge_graph = KnowledgeGraph()
-        self.current_user_id = "user_001"  # Simple user ID for demo
+        self.knowledge_graph = knowledge_graph if knowledge_graph is not None else KnowledgeGraph()
+        self.current_user_id = user_id  # Simple user ID for demo
         self.current_location = ""
+        self.search_locations = []  # normalized locations to search, when the user gave several
         self.current_cuisine = ""
         self.selected_restaurant = ""
-        self.cart = []
+        self.restaurants = []  # restaurants shown for the current search, in display order
+        self.cart = Cart()
         self.conversation_state = "greeting"
-        self.raw_menu_text = ""
-        self.structured_menu_text = ""
+        self.menu: Optional[Menu] = None  # parsed once when a restaurant is selected
+        self._prefetches = {}  # restaurant name -> menu prefetch key, while the user is choosing
+        # Held by the UI around a whole turn so two events from one session can't interleave
+        self.turn_lock = asyncio.Lock()
 
         
-        # Memory
-        self.memory = ConversationBufferWindowMemory(
-            memory_key="chat_history",
-            k=10,
-            return_messages=True
-        )
+        # Memory, bounded by MEMORY_MAX_TURNS / MEMORY_MAX_TOKENS / MEMORY_MAX_BYTES
+        self.memory = ConversationMemory()
         
         # Tools
         self.tools = [
@@ -85,313 +88,380 @@ class FoodOrderingAgent:
 
     def parse_llm_menu(self, menu_text: str) -> List[MenuItem]:
         """Parse LLM-formatted menu into structured MenuItem objects"""
-        items = []
-        lines = [line.strip() for line in menu_text.split("\n") if line.strip()]
-        for line in lines:
-            if line.lower().startswith("dish name") or line.count("|") != 3:
-                continue
-            try:
-                # name, price, category, desc = [part.strip() for part in line.split("|")]
-                raw_name, price, category, desc = [part.strip() for part in line.split("|")]
-                # Remove numbering prefix like "1. " from dish name
-                # name = re.sub(r"^\d+\.\s*", "", raw_name)
-                name = re.sub(r"^[•\-\d\. ]+", "", raw_name)
-
-                
-                price_float = float(price.replace("$", "").strip())
-                items.append(MenuItem(name=name, price=price_float, description=desc, category=category))
-            except Exception as e:
-                print(f"[Menu Parse Error]: {e} -- Line: {line}")
-        return items
+        return parse_menu(menu_text)
 
     
     def process_message(self, message: str) -> str:
         """Process user message and return response"""
+        with timed_turn(self.conversation_state):
+            return self._process_message(message)
+
+    async def aprocess_message(self, message: str) -> str:
+        """Async version of process_message that awaits tools instead of blocking"""
+        with timed_turn(self.conversation_state):
+            return await self._aprocess_message(message)
+
+    def _process_message(self, message: str) -> str:
         try:
-            response = ""
-
-            if any(kw in message.lower() for kw in ["cart", "show cart", "view cart"]):
-                response = self.get_cart_summary()
-                # Log memory (optional)
-                self.memory.chat_memory.add_user_message(message)
-                self.memory.chat_memory.add_ai_message(response)
-                return response
-            
-            # Simple state machine logic
-            if self.conversation_state == "greeting":
-                response = "Hello! Welcome to our food ordering service!  I'm here to help you find and order delicious food. What's your location so I can find restaurants near you?"
-                self.conversation_state = "location"
-                
-            # elif self.conversation_state == "location":
-            #     self.current_location = message.strip()
-            #     response = f"Great! I've set your location to {self.current_location}. What type of food are you craving today? (e.g., pizza, burgers, sushi, etc.)"
-            #     self.conversation_state = "food_preference"
-
-            elif self.conversation_state == "location":
+            if self._is_cart_query(message):
+                return self._remember(message, self.get_cart_summary())
+
+            # Simple state machine logic; network-bound steps live here, the rest is shared with aprocess_message
+            if self.conversation_state == "location":
+                places = split_choices(message.strip(), PLACE_SEPARATORS)
                 try:
-                    loc_tool = LocationNormalizerTool()
-                    norm = loc_tool._run(message.strip())
-                    self.current_location = norm.get("location", message.strip().title())
-                    response = f"Great! I've set your location to {self.current_location}. What type of food are you craving today? (e.g., pizza, burgers, sushi, etc.)"
-                    self.conversation_state = "food_preference"
+                    norms = LocationNormalizerTool()._run_many(places)
                 except Exception as e:
-                    print("Location normalization failed:", e)
-                    print("Location normalization failed:", e)
-                    self.current_location = message.strip().title()
-                    response = f"Okay, I've set your location to **{self.current_location}**. Now tell me what you're craving!"
-                    self.conversation_state = "food_preference"  # 👈 Advance state even in fallback
-                    # normalizer = LocationNormalizerTool()
-                #     result = normalizer._run(message)
-                #     self.current_location = result.get("location", message.title())
-                #     response = f"Great! I've set your location to **{self.current_location}**. What type of food are you craving today? (e.g., pizza, burgers, sushi, etc.)"
-                #     self.conversation_state = "food_preference"
-                # except Exception as e:
-                #     print("Location normalization failed:", e)
-                #     self.current_location = message.strip().title()
-                #     response = f"Okay, I've set your location to **{self.current_location}**. Now tell me what you're craving!"
-                #     self.conversation_state = "food_preference"
-
-                
+                    logger.warning("location_normalization_failed places=%r error=%s", places, e)
+                    FALLBACKS.inc(reason="location_error")
+                    norms = [None] * len(places)
+                response = self._set_locations(places, norms)
+
             elif self.conversation_state == "food_preference":
                 self.current_cuisine = message.strip()
                 # Use restaurant search tool
                 search_tool = RestaurantSearchTool()
-                restaurants = search_tool._run(self.current_location, self.current_cuisine)
-                response = f"{restaurants}\nWhich restaurant would you like to order from? Just tell me the name or number."
-                self.conversation_state = "restaurant_selection"
-                
-            elif self.conversation_state == "restaurant_selection":
-                # Parse restaurant selection
-                selection = message.strip().lower()
+                food_types = split_choices(self.current_cuisine)
+                if len(food_types) > 1 or len(self.search_locations) > 1:
+                    self.restaurants = search_tool._search_many(self.search_locations, food_types)
+                else:
+                    self.restaurants = search_tool._generate_restaurants(self.current_location, self.current_cuisine)
+                self._prefetch_menus()
+                response = self._restaurant_options(search_tool._format_results(self.restaurants, self.current_location, self.current_cuisine))
 
-                print(selection,self.current_cuisine)
-                
-                # Get the list of generated restaurants
-                search_tool = RestaurantSearchTool()
-                mock_restaurants = search_tool._generate_restaurants(self.current_location, self.current_cuisine)
-                
-                # Match selection to restaurant
-                selected_index = None
-                for i, restaurant in enumerate(mock_restaurants, 1):
-                    name = restaurant.name.lower()
-                
-                    if str(i) == selection:
-                        selected_index = i - 1
-                        break
-                    elif selection in name:  # 👈 allows partial match like "chianti"
-                        selected_index = i - 1
-                        break
-                # for i, restaurant in enumerate(mock_restaurants, 1):
-                #     if str(i) in selection or restaurant.name.lower() in selection:
-                #         selected_index = i - 1
-                #         break
-                
-                if selected_index is not None:
-                    self.selected_restaurant = mock_restaurants[selected_index].name
-                    cuisine_type = mock_restaurants[selected_index].cuisine_type
-                    
-                    # Get menu
-                    
-
-                    
-                    menu_tool = MenuTool()
-                    # raw_menu = menu_tool._run(self.selected_restaurant, cuisine_type)
-                    # self.raw_menu_text = raw_menu  
-
-                    formatted_menu, structured_menu = menu_tool._run(self.selected_restaurant, cuisine_type)
-                    self.raw_menu_text = formatted_menu
-                    self.structured_menu_text = structured_menu  # 👈 save this for parsing later
-
-                    
-                    # menu = menu_tool._run(self.selected_restaurant, cuisine_type)
-                    response = f"Excellent choice! Here's the menu for {self.selected_restaurant}:\n\n{formatted_menu}\n\nWhat would you like to add to your cart? You can say something like 'Add 2 Margherita Pizza' or 'I want the Caesar Salad'."
-                    self.conversation_state = "ordering"
+            elif self.conversation_state == "restaurant_selection":
+                restaurant = self._match_restaurant(message, self.restaurants)
+                if restaurant:
+                    self._release_prefetches(keep=restaurant.name)
+                    menu = MenuTool()._get_menu(restaurant.name, restaurant.cuisine_type)
+                    self._release_prefetches()
+                    response = self._show_menu(restaurant, menu)
                 else:
                     response = "I didn't catch that. Please select one of the restaurants listed above."
-                
-            
-            elif self.conversation_state == "ordering":
-                if any(k in message.lower() for k in ["add", "want", "order"]):
+
+            elif self.conversation_state == "ordering" and self._is_add_request(message):
+                parsed = self._parse_order(message)
+                if parsed.confident:
+                    response = self._add_items(parsed.items, parsed.unmatched)
+                else:
                     # Call LLM to parse cart items
-                    cart_extractor_prompt = CART_EXTRACTION_PROMPT.format(
-                        menu=self.raw_menu_text,
-                        message=message
-                    )
-                    llm_response = self.llm.invoke(cart_extractor_prompt)
-                    raw_json_text = llm_response.content
-                    cleaned_json = re.search(r"\[.*\]", raw_json_text, re.DOTALL)
-                    if cleaned_json:
-                        raw_json_text = cleaned_json.group(0)
-
-                    try:
-                        extracted_items = json.loads(raw_json_text)
-                    except Exception as e:
-                        print("Failed to parse JSON:", e)
-                        extracted_items = []
-
-                    print("LLM Extracted Cart JSON:", llm_response)
-                    print("extracted_items",extracted_items)
-
-                    
-                    # try:
-                    #     extracted_items = json.loads(llm_response)
-                    # except Exception as e:
-                    #     print("Failed to parse JSON:", e)
-                    #     extracted_items = []
+                    response = self._llm_add_items(message)
+
+            else:
+                response = self._handle_local_turn(message)
+
+            # Add to memory
+            return self._remember(message, response)
             
-                    # menu_items = self.parse_llm_menu(self.raw_menu_text)
-                    menu_items = self.parse_llm_menu(self.structured_menu_text)
-                    print("Parsed Menu Items:", [m.name for m in menu_items])
+        except Exception as e:
+            return f"I apologize, but I encountered an error: {str(e)}. Let's start over - what's your location?"
 
+    async def _aprocess_message(self, message: str) -> str:
+        try:
+            if self._is_cart_query(message):
+                return self._remember(message, self.get_cart_summary())
 
-                    # menu_lookup = {item.name.lower(): item for item in menu_items}
-                    menu_lookup = {normalize(item.name): item for item in menu_items}
+            if self.conversation_state == "location":
+                places = split_choices(message.strip(), PLACE_SEPARATORS)
+                try:
+                    norms = await LocationNormalizerTool()._arun_many(places)
+                except Exception as e:
+                    logger.warning("location_normalization_failed places=%r error=%s", places, e)
+                    FALLBACKS.inc(reason="location_error")
+                    norms = [None] * len(places)
+                response = self._set_locations(places, norms)
 
-                    print("menu items, menu look up", menu_items,menu_lookup)
-            
-                    added = []
-                    unmatched = []
-                    for entry in extracted_items:
-                        
-                        name = normalize(entry["item"])
-                        matched = menu_lookup.get(name)
-                        quantity = entry.get("quantity", 1)
-
-                        print(f"User requested item: {entry['item']} — matched to: {matched.name if matched else 'None'}")
-                        # print(f"User requested item: {entry['item']} — matched to: {matched.name if matched else None}")
-
-
-                        if not matched:
-                            close = get_close_matches(name, list(menu_lookup.keys()), n=1, cutoff=0.5)
-                            if close:
-                                matched = menu_lookup[close[0]]
-
-                        if matched:
-                            self.cart.append(CartItem(matched, quantity))
-                            added.append(f"{quantity} x {matched.name}")
-                        else:
-                            print(f"Unmatched item: {entry['item']}")
-                            unmatched.append(entry["item"])
-                        
-                        # quantity = entry.get("quantity", 1)
-                        # if name in menu_lookup:
-                        #     self.cart.append(CartItem(menu_lookup[name], quantity))
-                        #     added.append(f"{quantity} x {menu_lookup[name].name}")
-            
-                    
+            elif self.conversation_state == "food_preference":
+                self.current_cuisine = message.strip()
+                search_tool = RestaurantSearchTool()
+                food_types = split_choices(self.current_cuisine)
+                if len(food_types) > 1 or len(self.search_locations) > 1:
+                    self.restaurants = await search_tool._asearch_many(self.search_locations, food_types)
+                else:
+                    self.restaurants = await search_tool._agenerate_restaurants(self.current_location, self.current_cuisine)
+                self._prefetch_menus()
+                response = self._restaurant_options(search_tool._format_results(self.restaurants, self.current_location, self.current_cuisine))
+
+            elif self.conversation_state == "restaurant_selection":
+                restaurant = self._match_restaurant(message, self.restaurants)
+                if restaurant:
+                    self._release_prefetches(keep=restaurant.name)
+                    menu = await MenuTool()._aget_menu(restaurant.name, restaurant.cuisine_type)
+                    self._release_prefetches()
+                    response = self._show_menu(restaurant, menu)
+                else:
+                    response = "I didn't catch that. Please select one of the restaurants listed above."
 
-                    if added:
-                        cart_summary = self.get_cart_summary()
-                        response = f"🛒 Added to cart:\n- " + "\n- ".join(added) + f"\n\n{cart_summary}\n\nWould you like to add more or checkout?"
-                        if unmatched:
-                            response += "\n\n🚫 The following items were not found on the menu and were **not** added to your cart:\n- " + "\n- ".join(unmatched)
-                        
-                        # response += f"\n\n{cart_summary}\n\nWould you like to add more or checkout?"
+            elif self.conversation_state == "ordering" and self._is_add_request(message):
+                parsed = self._parse_order(message)
+                if parsed.confident:
+                    response = self._add_items(parsed.items, parsed.unmatched)
+                else:
+                    response = await self._allm_add_items(message)
 
+            else:
+                response = self._handle_local_turn(message)
 
-                    else:
-                        response = f"🚫 None of those items were found on the menu. Here's the menu again:\n\n{self.raw_menu_text}"
-            
-                # elif "checkout" in message.lower():
-                #     if self.cart:
-                #         cart_summary = self.get_cart_summary()
-                #         response = f"🧾 Order Summary:\n\n{cart_summary}\n\nWould you like to confirm your order? (yes/no)"
-                #         self.conversation_state = "confirmation"
-                #     else:
-                #         response = "🛒 Your cart is empty. Add some items first!"
-
-                elif any(k in message.lower() for k in ["remove", "delete"]):
-                    
-                    # Try to parse what to remove
-                    to_remove = re.findall(r"\d*\s*\w+", message.lower())
-                    removed = []
-                    for entry in to_remove:
-                        parts = entry.strip().split()
-                        if len(parts) == 2:
-                            qty_text, item_text = parts
-                        else:
-                            qty_text = "1"
-                            item_text = parts[0]
-                        
-                        try:
-                            quantity = int(qty_text)
-                        except ValueError:
-                            quantity = 1
-                
-                        item_name = normalize(item_text)
-                        match_found = False
-                        for cart_item in self.cart:
-                            if normalize(cart_item.item.name) == item_name:
-                                if cart_item.quantity <= quantity:
-                                    self.cart.remove(cart_item)
-                                else:
-                                    cart_item.quantity -= quantity
-                                removed.append(f"{quantity} x {cart_item.item.name}")
-                                match_found = True
-                                break
-                        
-                        if not match_found:
-                            cart_lookup = {normalize(ci.item.name): ci for ci in self.cart}
-                            close = get_close_matches(item_name, list(cart_lookup.keys()), n=1, cutoff=0.6)
-                            
-                            if close:
-                                matched_cart_item = cart_lookup[close[0]]
-                                if matched_cart_item.quantity <= quantity:
-                                    self.cart.remove(matched_cart_item)
-                                else:
-                                    matched_cart_item.quantity -= quantity
-                                removed.append(f"{quantity} x {matched_cart_item.item.name}")
-                                match_found = True
+            return self._remember(message, response)
+
+        except Exception as e:
+            return f"I apologize, but I encountered an error: {str(e)}. Let's start over - what's your location?"
+
+    async def astream_message(self, message: str) -> AsyncIterator[str]:
+        """Like aprocess_message, but yields the response as it builds up.
+
+        Each yield is the full response so far. Menu generation streams item by
+        item; other LLM turns yield a placeholder while waiting.
+        """
+        try:
+            if self.conversation_state == "restaurant_selection" and not self._is_cart_query(message):
+                restaurant = self._match_restaurant(message, self.restaurants)
+                if restaurant:
+                    with timed_turn("restaurant_selection"):
+                        self._release_prefetches(keep=restaurant.name)
+                        menu = None
+                        async for update in MenuTool()._astream_menu(restaurant.name, restaurant.cuisine_type):
+                            if isinstance(update, list):
+                                yield f"Excellent choice! Here's the menu for {restaurant.name}:\n\n{format_menu(restaurant.name, update)}"
                             else:
-                                print(f"No matching item found in cart for: {item_name}")
-                    
-                    if removed:
-                        cart_summary = self.get_cart_summary()
-                        response = f"🗑️ Removed from cart:\n- " + "\n- ".join(removed) + f"\n\n{cart_summary}\n\nWould you like to add more or checkout?"
-                    else:
-                        response = f"⚠️ Couldn't find those items in your cart. Try using the item names as shown in the menu."
+                                menu = update
+                        self._release_prefetches()
+                        yield self._remember(message, self._show_menu(restaurant, menu))
+                    return
+
+            elif (self.conversation_state == "ordering" and not self._is_cart_query(message)
+                  and self._is_add_request(message)):
+                parsed = self._parse_order(message)
+                if not parsed.confident:
+                    with timed_turn("ordering"):
+                        yield "🛒 Updating your cart..."
+                        yield self._remember(message, await self._allm_add_items(message))
+                    return
 
+        except Exception as e:
+            yield f"I apologize, but I encountered an error: {str(e)}. Let's start over - what's your location?"
+            return
 
-            
-                elif "checkout" in message.lower() or "done" in message.lower():
-                    if self.cart:
-                        cart_summary = self.get_cart_summary()
-                        response = f"Perfect! Here's your order summary:\n\n{cart_summary}\n\nWould you like to confirm this order? (yes/no)"
-                        self.conversation_state = "confirmation"
-                    else:
-                        response = "Your cart is empty. Please add some items first!"
-                
-                    # else:
-                    #     response = "I can help you add items to your cart. Try saying 'Add [item name]' or 'checkout' when you're ready."
-
-                    
-            elif self.conversation_state == "confirmation":
-                if "yes" in message.lower():
-                    order_id = self.process_order()
-                    response = f"🎉 Order confirmed! Your order #{order_id} has been placed successfully.\n\nDelivery time: 30-45 minutes\nRestaurant: {self.selected_restaurant}\nTotal: ${self.get_total():.2f}\n\nThank you for your order! You'll receive updates via SMS."
-                    self.save_user_preferences()
-                    self.reset_conversation()
-                else:
-                    response = "No problem! You can continue adding items or modify your order. What would you like to do?"
-                    self.conversation_state = "ordering"
+        yield await self.aprocess_message(message)
 
-            
-                # return response
+    def _remember(self, message: str, response: str) -> str:
+        stored = response
+        if self.menu is not None and self.menu.text in stored:
+            # The menu can be rebuilt from self.menu; keep a reference instead of the full text
+            stored = stored.replace(self.menu.text, f"[menu for {self.menu.restaurant_name}: {len(self.menu.items)} items]")
+        self.memory.add_turn(message, stored)
+        return response
 
+    def _is_cart_query(self, message: str) -> bool:
+        return any(kw in message.lower() for kw in ["cart", "show cart", "view cart"])
 
-            
+    def _is_add_request(self, message: str) -> bool:
+        return any(k in message.lower() for k in ["add", "want", "order"])
+
+    def _set_locations(self, places: List[str], norms: List[Optional[dict]]) -> str:
+        self.search_locations = [
+            norm.get("location", place.title()) if norm else place.title() for place, norm in zip(places, norms)
+        ]
+        self.current_location = " or ".join(self.search_locations)
+        if any(norms):
+            response = f"Great! I've set your location to {self.current_location}. What type of food are you craving today? (e.g., pizza, burgers, sushi, etc.)"
+        else:
+            response = f"Okay, I've set your location to **{self.current_location}**. Now tell me what you're craving!"
+        self.conversation_state = "food_preference"  # 👈 Advance state even in fallback
+        return response
+
+    def _restaurant_options(self, restaurants: str) -> str:
+        self.conversation_state = "restaurant_selection"
+        return f"{restaurants}\nWhich restaurant would you like to order from? Just tell me the name or number."
+
+    def _prefetch_menus(self):
+        """Start generating menus for the top restaurants shown, so selecting one is instant"""
+        self._release_prefetches()
+        for restaurant in self.restaurants[:MENU_PREFETCH_COUNT]:
+            key = menu_prefetcher.prefetch(restaurant.name, restaurant.cuisine_type)
+            if key is not None:
+                self._prefetches[restaurant.name] = key
+
+    def _release_prefetches(self, keep: Optional[str] = None):
+        """Drop this session's claim on prefetched menus, except `keep`'s"""
+        for name in [n for n in self._prefetches if n != keep]:
+            menu_prefetcher.release(self._prefetches.pop(name))
+
+    def _match_restaurant(self, message: str, mock_restaurants: List[Restaurant]) -> Optional[Restaurant]:
+        """Match a name or list number to one of the shown restaurants"""
+        selection = message.strip().lower()
+        logger.debug("restaurant_selection selection=%r cuisine=%r", selection, self.current_cuisine)
+
+        for i, restaurant in enumerate(mock_restaurants, 1):
+            name = restaurant.name.lower()
+
+            if str(i) == selection:
+                return restaurant
+            elif selection in name:  # 👈 allows partial match like "chianti"
+                return restaurant
+        return None
+
+    def _show_menu(self, restaurant: Restaurant, menu: Optional[Menu]) -> str:
+        if menu is None:
+            FALLBACKS.inc(reason="menu_unavailable")
+            return MENU_UNAVAILABLE
+        self.selected_restaurant = restaurant.name
+        self.menu = menu
+        self.conversation_state = "ordering"
+        return f"Excellent choice! Here's the menu for {self.selected_restaurant}:\n\n{menu.text}\n\nWhat would you like to add to your cart? You can say something like 'Add 2 Margherita Pizza' or 'I want the Caesar Salad'."
+
+    def _parse_order(self, message: str) -> ParsedOrder:
+        with span("parse.order"):
+            return parse_order(message, self.menu)
+
+    def _llm_add_items(self, message: str) -> str:
+        """Cart extraction with the LLM, for messages the rule-based parser wasn't sure about"""
+        FALLBACKS.inc(reason="order_parser_to_llm")
+        with span("llm.cart_extraction"):
+            llm_response = self.llm.invoke(self._cart_extraction_prompt(message))
+        record_llm_usage(llm_response, "cart_extraction")
+        return self._add_extracted_items(llm_response)
+
+    async def _allm_add_items(self, message: str) -> str:
+        FALLBACKS.inc(reason="order_parser_to_llm")
+        with span("llm.cart_extraction"):
+            llm_response = await self.llm.ainvoke(self._cart_extraction_prompt(message))
+        record_llm_usage(llm_response, "cart_extraction")
+        return self._add_extracted_items(llm_response)
+
+    def _cart_extraction_prompt(self, message: str) -> str:
+        prompt = CART_EXTRACTION_PROMPT.format(
+            menu=self.menu.compact_text,
+            history=self.memory.render(MEMORY_PROMPT_TOKENS) or "(none)",
+            message=message
+        )
+        return record_prompt(prompt, "cart_extraction")
+
+    def _add_extracted_items(self, llm_response) -> str:
+        """Add the items from a CART_EXTRACTION_PROMPT completion to the cart"""
+        raw_json_text = llm_response.content
+        cleaned_json = re.search(r"\[.*\]", raw_json_text, re.DOTALL)
+        if cleaned_json:
+            raw_json_text = cleaned_json.group(0)
+
+        try:
+            extracted_items = json.loads(raw_json_text)
+        except Exception as e:
+            logger.warning("cart_extraction_unparsed error=%s response=%r", e, raw_json_text)
+            extracted_items = []
+
+        logger.debug("cart_extraction items=%r menu_items=%d", extracted_items, len(self.menu.items))
+
+        matches = []
+        unmatched = []
+        for entry in extracted_items:
+            if not isinstance(entry, dict):
+                continue
+            matched = self.menu.by_id(entry.get("id"))
+            if matched is None and entry.get("item"):
+                # Model answered with a dish name instead of an id
+                FALLBACKS.inc(reason="cart_id_to_name")
+                with span("match.menu"):
+                    matched = self.menu.match(str(entry["item"]))
+            quantity = self._quantity(entry.get("quantity", 1))
+
+            logger.debug("cart_item_match entry=%r matched=%r", entry, matched and matched.name)
+
+            if matched:
+                matches.append((matched, quantity))
             else:
-                response = "I'm here to help you order food! Would you like to start a new order?"
-                self.conversation_state = "greeting"
-            
-            # Add to memory
-            self.memory.chat_memory.add_user_message(message)
-            self.memory.chat_memory.add_ai_message(response)
-            
-            return response
+                unmatched.append(str(entry.get("item") or entry.get("id")))
+        return self._add_items(matches, unmatched)
+
+    @staticmethod
+    def _quantity(value) -> int:
+        """LLM quantities can be strings, floats or nonsense; the cart takes an int >= 1"""
+        try:
+            return max(1, int(float(value)))
+        except (TypeError, ValueError):
+            return 1
+
+    def _add_items(self, matches: List[Tuple[MenuItem, int]], unmatched: List[str]) -> str:
+        """Add resolved (item, quantity) pairs to the cart and describe the result"""
+        added = []
+        for item, quantity in matches:
+            self.cart.add(item, quantity)
+            added.append(f"{quantity} x {item.name}")
+
+        if added:
+            cart_summary = self.get_cart_summary()
+            response = f"🛒 Added to cart:\n- " + "\n- ".join(added) + f"\n\n{cart_summary}\n\nWould you like to add more or checkout?"
+            if unmatched:
+                response += "\n\n🚫 The following items were not found on the menu and were **not** added to your cart:\n- " + "\n- ".join(unmatched)
+        else:
+            response = f"🚫 None of those items were found on the menu. Here's the menu again:\n\n{self.menu.text}"
+        return response
+
+    def _handle_local_turn(self, message: str) -> str:
+        """State transitions that need no LLM or search call"""
+        response = ""
+        if self.conversation_state == "greeting":
+            response = "Hello! Welcome to our food ordering service!  I'm here to help you find and order delicious food. What's your location so I can find restaurants near you?"
+            self.conversation_state = "location"
+
+        elif self.conversation_state == "ordering":
+            if any(k in message.lower() for k in ["remove", "delete"]):
+                response = self._remove_from_cart(message)
+
+            elif "checkout" in message.lower() or "done" in message.lower():
+                if self.cart:
+                    cart_summary = self.get_cart_summary()
+                    response = f"Perfect! Here's your order summary:\n\n{cart_summary}\n\nWould you like to confirm this order? (yes/no)"
+                    self.conversation_state = "confirmation"
+                else:
+                    response = "Your cart is empty. Please add some items first!"
+
+        elif self.conversation_state == "confirmation":
+            if "yes" in message.lower():
+                # Order and preferences are committed in one transaction
+                with self.knowledge_graph.batch():
+                    order_id = self.process_order()
+                    self.save_user_preferences()
+                response = f"🎉 Order confirmed! Your order #{order_id} has been placed successfully.\n\nDelivery time: 30-45 minutes\nRestaurant: {self.selected_restaurant}\nTotal: ${self.get_total():.2f}\n\nThank you for your order! You'll receive updates via SMS."
+                self.reset_conversation()
+            else:
+                response = "No problem! You can continue adding items or modify your order. What would you like to do?"
+                self.conversation_state = "ordering"
+
+        else:
+            response = "I'm here to help you order food! Would you like to start a new order?"
+            self.conversation_state = "greeting"
+        return response
+
+    def _remove_from_cart(self, message: str) -> str:
+        # Try to parse what to remove
+        to_remove = re.findall(r"\d*\s*\w+", message.lower())
+        removed = []
+        for entry in to_remove:
+            parts = entry.strip().split()
+            if len(parts) == 2:
+                qty_text, item_text = parts
+            else:
+                qty_text = "1"
+                item_text = parts[0]
             
-        except Exception as e:
-            return f"I apologize, but I encountered an error: {str(e)}. Let's start over - what's your location?"
+            try:
+                quantity = int(qty_text)
+            except ValueError:
+                quantity = 1
+    
+            item_name = normalize(item_text)
+            cart_item = self.cart.match(item_name, cutoff=0.6)
+            if cart_item:
+                self.cart.remove(cart_item.item, quantity)
+                removed.append(f"{quantity} x {cart_item.item.name}")
+            else:
+                logger.debug("cart_remove_unmatched item=%r", item_name)
+        
+        if removed:
+            cart_summary = self.get_cart_summary()
+            return f"🗑️ Removed from cart:\n- " + "\n- ".join(removed) + f"\n\n{cart_summary}\n\nWould you like to add more or checkout?"
+        return f"⚠️ Couldn't find those items in your cart. Try using the item names as shown in the menu."
     
     def get_cart_summary(self) -> str:
         """Get formatted cart summary"""
@@ -399,22 +469,20 @@ class FoodOrderingAgent:
             return "Your cart is empty."
         
         summary = f"🛒 Your Cart ({self.selected_restaurant}):\n"
-        total = 0
         for cart_item in self.cart:
-            item_total = cart_item.item.price * cart_item.quantity
-            summary += f"- {cart_item.quantity}x {cart_item.item.name}: ${item_total:.2f}\n"
-            total += item_total
+            summary += f"- {cart_item.quantity}x {cart_item.item.name}: ${cart_item.line_cents / 100:.2f}\n"
         
-        summary += f"\n💰 Total: ${total:.2f}"
+        summary += f"\n💰 Total: ${self.cart.total:.2f}"
         return summary
     
     def get_total(self) -> float:
         """Calculate total cart value"""
-        return sum(item.item.price * item.quantity for item in self.cart)
+        return self.cart.total
     
     def process_order(self) -> str:
         """Process the order"""
-        order_id = f"ORD{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Random suffix: orders from other sessions/workers can land in the same second
+        order_id = f"ORD{datetime.now().strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:6].upper()}"
         
         # Save order to knowledge graph
         order_data = {
@@ -427,32 +495,42 @@ class FoodOrderingAgent:
             "location": self.current_location
         }
         
-        self.knowledge_graph.orders[order_id] = order_data
-        print(f"✅ Order added to Knowledge Graph: {order_id}")
-        self.knowledge_graph.debug_view()
+        self.knowledge_graph.add_order(order_data)
+        logger.info(
+            "order_placed order_id=%s user_id=%s restaurant=%r items=%d total=%.2f",
+            order_id, self.current_user_id, self.selected_restaurant, len(order_data["items"]), order_data["total"],
+        )
         
         return order_id
     
     def save_user_preferences(self):
         """Save user preferences to knowledge graph"""
         if self.selected_restaurant:
-            # Get cuisine type from generated restaurants
-            search_tool = RestaurantSearchTool()
-            mock_restaurants = search_tool._generate_restaurants(self.current_location, self.current_cuisine)
-            current_restaurant = next((r for r in mock_restaurants if r.name == self.selected_restaurant), None)
+            # Get cuisine type from the restaurants shown in this session
+            current_restaurant = next((r for r in self.restaurants if r.name == self.selected_restaurant), None)
             
             if current_restaurant:
+                self.knowledge_graph.add_restaurant(current_restaurant)
                 self.knowledge_graph.update_user_preferences(
                     self.current_user_id,
                     current_restaurant.cuisine_type,
                     self.selected_restaurant
                 )
     
+    def close(self):
+        """Release background work held for this session"""
+        self._release_prefetches()
+
     def reset_conversation(self):
         """Reset for new conversation"""
         self.conversation_state = "greeting"
         self.current_location = ""
+        self.search_locations = []
         self.current_cuisine = ""
         self.selected_restaurant = ""
-        self.cart = []
+        self.restaurants = []
+        self._release_prefetches()
+        self.menu = None
+        self.cart = Cart()
+        self.memory.clear()
 
@@ -1,26 +1,65 @@
+from datetime import date, timedelta
 import gradio as gr
-from agent import FoodOrderingAgent
-from utils import render_knowledge_graph
-from prompts import GROQ_API_KEY
+import metrics
+from logconfig import iterate_in_session, set_session_debug, setup_logging
+from metrics import span
+from sessions import SessionManager
+from utils import GraphScope, arender_knowledge_graph
+from prompts import CHAT_CONCURRENCY, GROQ_API_KEY, DEBUG_ENDPOINTS, KG_RENDER_CONCURRENCY
+
+# Knowledge graph time windows, in days
+KG_WINDOWS = {"All time": None, "Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90}
 
 
 def create_chatbot_interface():
-    agent = FoodOrderingAgent()
+    sessions = SessionManager()
     
-    def chat_fn(message, history):
+    async def chat_fn(message, history, request: gr.Request):
         if not message.strip():
-            return history, ""
-        response = agent.process_message(message)
-        history.append((message, response))
-        return history, ""
+            yield history, ""
+            return
+        # Covers the agent turn plus Gradio's per-update overhead
+        with span("ui.chat"):
+            agent = sessions.get(request.session_hash)
+            # Other sessions run in parallel; this session's turns run one after another
+            async with agent.turn_lock:
+                history.append((message, ""))
+                # Stream partial responses into the last chat bubble
+                async for partial in iterate_in_session(request.session_hash, agent.astream_message(message)):
+                    history[-1] = (message, partial)
+                    yield history, ""
     
-    def reset_fn():
-        agent.reset_conversation()
+    def reset_fn(request: gr.Request):
+        sessions.get(request.session_hash).reset_conversation()
         return [], ""
 
-    def show_kg_fn():
-        img = render_knowledge_graph(agent)
-        return img
+    async def show_kg_fn(all_users, window, restaurants, dishes, page, fmt, request: gr.Request):
+        agent = sessions.get(request.session_hash)
+        days = KG_WINDOWS.get(window)
+        scope = GraphScope(
+            user_id=None if all_users else agent.current_user_id,
+            since=(date.today() - timedelta(days=days)).isoformat() if days else None,
+            restaurants=int(restaurants),
+            dishes=int(dishes),
+            page=max(0, int(page or 0)),
+        )
+        fmt = fmt.lower()
+        graph = await arender_knowledge_graph(agent, scope, fmt)
+        return (
+            gr.update(value=graph if fmt == "png" else None, visible=fmt == "png"),
+            gr.update(value=graph if fmt == "svg" else "", visible=fmt == "svg"),
+            gr.update(value=graph if fmt == "json" else None, visible=fmt == "json"),
+        )
+
+    def close_fn(request: gr.Request):
+        set_session_debug(request.session_hash, False)
+        sessions.drop(request.session_hash)
+
+    def debug_kg_fn():
+        return sessions.knowledge_graph.debug_view()
+
+    def debug_log_fn(enabled, request: gr.Request):
+        set_session_debug(request.session_hash, enabled)
     
     with gr.Blocks(title="Food Ordering Chatbot", theme=gr.themes.Soft()) as demo:
         gr.Markdown("# 🍕 Food Ordering Chatbot")
@@ -37,12 +76,35 @@ def create_chatbot_interface():
         with gr.Row():
             show_kg_btn = gr.Button("Show Knowledge Graph", variant="secondary")
             kg_image = gr.Image(type="pil", label="Knowledge Graph")
+            kg_svg = gr.HTML(visible=False)
+            kg_json = gr.JSON(label="Knowledge Graph", visible=False)
+        with gr.Row():
+            kg_all_users = gr.Checkbox(label="All users", value=False)
+            kg_window = gr.Dropdown(list(KG_WINDOWS), value="All time", label="Time window")
+            kg_restaurants = gr.Slider(1, 25, value=10, step=1, label="Top restaurants")
+            kg_dishes = gr.Slider(1, 50, value=15, step=1, label="Top dishes")
+            kg_page = gr.Number(value=0, minimum=0, precision=0, label="Page")
+            kg_format = gr.Radio(["PNG", "SVG", "JSON"], value="PNG", label="Format")
 
         # Event handlers
-        msg.submit(chat_fn, inputs=[msg, chatbot], outputs=[chatbot, msg])
-        send_btn.click(chat_fn, inputs=[msg, chatbot], outputs=[chatbot, msg])
+        # Both events share one concurrency group; Gradio's default of 1 would serialize every user's turns
+        msg.submit(chat_fn, inputs=[msg, chatbot], outputs=[chatbot, msg],
+                   concurrency_limit=CHAT_CONCURRENCY, concurrency_id="chat")
+        send_btn.click(chat_fn, inputs=[msg, chatbot], outputs=[chatbot, msg],
+                       concurrency_limit=CHAT_CONCURRENCY, concurrency_id="chat")
         clear_btn.click(reset_fn, outputs=[chatbot, msg])
-        show_kg_btn.click(show_kg_fn, outputs=kg_image)
+        show_kg_btn.click(show_kg_fn, inputs=[kg_all_users, kg_window, kg_restaurants, kg_dishes, kg_page, kg_format],
+                          outputs=[kg_image, kg_svg, kg_json], concurrency_limit=KG_RENDER_CONCURRENCY)
+        demo.unload(close_fn)
+
+        # Full knowledge-graph dump; costs O(total history), so only exposed when FOODBOT_DEBUG=1
+        if DEBUG_ENDPOINTS:
+            with gr.Accordion("Debug", open=False):
+                debug_kg_btn = gr.Button("Dump Knowledge Graph", variant="secondary")
+                debug_kg_text = gr.Code(label="Knowledge Graph State")
+                debug_log = gr.Checkbox(label="DEBUG logs for this session", value=False)
+            debug_kg_btn.click(debug_kg_fn, outputs=debug_kg_text, api_name="debug_knowledge_graph")
+            debug_log.change(debug_log_fn, inputs=debug_log)
 
         # Instructions
         gr.Markdown("""
@@ -75,6 +137,9 @@ def create_chatbot_interface():
 
 
 if __name__ == "__main__":
+    # Queue-backed handler; levels from LOG_LEVEL and per-module LOG_LEVELS
+    setup_logging()
+
     # Set up environment variables (you'll need to set these)
     if not GROQ_API_KEY:
         print("⚠️  Please set GROQ_API_KEY environment variable")
@@ -85,5 +150,9 @@ if __name__ == "__main__":
     demo.launch(
         server_name="0.0.0.0",
         
-        share=True  # Set to False for local only
-    )
\ No newline at end of file
+        share=True,  # Set to False for local only
+        prevent_thread_lock=True,
+    )
+    # Prometheus scrape endpoint (and profiler controls with FOODBOT_DEBUG=1) on the same server
+    metrics.install(demo.app, debug=DEBUG_ENDPOINTS)
+    demo.block_thread()
\ No newline at end of file
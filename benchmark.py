@@ -0,0 +1,241 @@
+"""End-to-end conversation benchmark.
+
+Drives scripted conversations through every agent state (greeting, location,
+food_preference, restaurant_selection, ordering, confirmation) with Groq
+replaced by a local fake LLM and SerpAPI by the fixture search provider,
+both with configurable latency. Reports p50/p95/p99 turn latency per state,
+overall turns per second and memory per session.
+
+    python benchmark.py --sessions 200 --concurrency 20 --llm-latency 0.3 --search-latency 0.15
+    python benchmark.py --mode sync --json > bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+SCRIPTS = [
+    # Happy path, everything resolved locally after the first menu
+    ["hi", "koramangala", "pizza", "1", "add 2 margherita pizza", "add 1 garlic bread and 2 tiramisu",
+     "show cart", "remove 1 tiramisu", "checkout", "yes"],
+    # Several cuisines at once, a vague dish that needs the LLM
+    ["hello", "I live in Indiranagar, Bengaluru", "pizza or sushi", "2", "I want the chefs special please",
+     "add 2 salmon sushi roll", "checkout", "yes"],
+    # Unknown location (LLM), declined then confirmed checkout
+    ["hi", "somewhere near the old clock tower", "burgers", "3", "add 1 classic burger", "checkout", "no",
+     "checkout", "yes"],
+]
+
+FAKE_MENU = "\n".join([
+    "Dish Name | Price | Category | Description",
+    "Margherita Pizza | $12.99 | Main Course | Tomato, mozzarella and basil.",
+    "Garlic Bread | $5.49 | Appetizer | Toasted with herb butter.",
+    "Classic Burger | $10.99 | Main Course | Beef patty, cheddar, pickles.",
+    "Salmon Sushi Roll | $14.50 | Main Course | Fresh salmon and avocado.",
+    "Chefs Special Curry | $13.25 | Main Course | Slow-cooked house curry.",
+    "Tiramisu | $6.50 | Dessert | Espresso-soaked ladyfingers.",
+])
+
+
+class FakeLLM:
+    """Stand-in for ChatGroq: canned answers per prompt type after a fixed delay"""
+
+    def __init__(self, latency: float = 0.0, chunk_size: int = 24):
+        self.latency = latency
+        self.chunk_size = chunk_size
+
+    def invoke(self, prompt, *args, **kwargs):
+        time.sleep(self.latency)
+        return self._message(str(prompt))
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._message(str(prompt))
+
+    async def astream(self, prompt, *args, **kwargs):
+        from langchain_core.messages import AIMessageChunk
+
+        text = self._answer(str(prompt))
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        # Time to first token ~ a third of the full latency, the rest spread over the chunks
+        await asyncio.sleep(self.latency / 3)
+        for chunk in chunks:
+            yield AIMessageChunk(content=chunk)
+            await asyncio.sleep(2 * self.latency / 3 / len(chunks))
+
+    def _message(self, prompt: str):
+        from langchain_core.messages import AIMessage
+
+        return AIMessage(content=self._answer(prompt))
+
+    def _answer(self, prompt: str) -> str:
+        if "menu designer" in prompt:
+            return FAKE_MENU
+        if "location string" in prompt:
+            place = re.search(r'Input: "(.*)"', prompt)
+            return json.dumps({"location": (place.group(1) if place else "Unknown").title(), "ll": "0,0"})
+        dish = re.search(r"^(\d+): ", prompt, re.MULTILINE)
+        return json.dumps([{"id": int(dish.group(1)), "quantity": 1}] if dish else [])
+
+
+def percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def run_session(agent, script, latencies):
+    for message in script:
+        state = agent.conversation_state
+        started = time.perf_counter()
+        agent.process_message(message)
+        latencies[state].append(time.perf_counter() - started)
+
+
+async def arun_session(agent, script, latencies):
+    for message in script:
+        state = agent.conversation_state
+        started = time.perf_counter()
+        # Same entry point as the Gradio chat handler
+        async for _ in agent.astream_message(message):
+            pass
+        latencies[state].append(time.perf_counter() - started)
+
+
+def run_load(args, knowledge_graph):
+    from agent import FoodOrderingAgent
+
+    latencies = defaultdict(list)
+    scripts = [SCRIPTS[i % len(SCRIPTS)] for i in range(args.sessions)]
+
+    def new_agent(i):
+        return FoodOrderingAgent(knowledge_graph=knowledge_graph, user_id=f"bench_{i % args.users}")
+
+    started = time.perf_counter()
+    if args.mode == "sync":
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda i: run_session(new_agent(i), scripts[i], latencies), range(args.sessions)))
+    else:
+        async def main():
+            gate = asyncio.Semaphore(args.concurrency)
+
+            async def one(i):
+                async with gate:
+                    await arun_session(new_agent(i), scripts[i], latencies)
+            await asyncio.gather(*(one(i) for i in range(args.sessions)))
+        asyncio.run(main())
+    return latencies, time.perf_counter() - started
+
+
+def measure_memory(args, knowledge_graph) -> float:
+    """Average traced bytes held per live session after a full conversation"""
+    from agent import FoodOrderingAgent
+
+    agents = []
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    for i in range(args.memory_sessions):
+        agent = FoodOrderingAgent(knowledge_graph=knowledge_graph, user_id=f"mem_{i}")
+        # Stop before checkout so the session still holds its menu and cart
+        script = SCRIPTS[i % len(SCRIPTS)]
+        for message in script[:script.index("checkout")]:
+            agent.process_message(message)
+        agents.append(agent)
+    held = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+    tracemalloc.stop()
+    return held / max(1, len(agents))
+
+
+def configure_environment(args, workdir: str):
+    """Point every external dependency at a local stand-in; must run before the app modules are imported"""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ["SEARCH_PROVIDER"] = "fixture"
+    os.environ["SEARCH_FIXTURE_LATENCY"] = str(args.search_latency)
+    os.environ["SEARCH_FIXTURE_ERROR_RATE"] = str(args.search_error_rate)
+    os.environ["KG_STORE"] = args.store
+    os.environ["KG_DB_PATH"] = os.path.join(workdir, "knowledge_graph.db")
+    os.environ["MENU_CACHE_PATH"] = os.path.join(workdir, "menu_cache.db")
+    os.environ["LOCATION_CACHE_PATH"] = os.path.join(workdir, "location_cache.db")
+
+    from prompts import set_llm_factory
+    set_llm_factory(lambda temperature, model_name: FakeLLM(latency=args.llm_latency))
+
+
+def report(latencies, elapsed: float, memory_per_session: float, args) -> dict:
+    turns = sum(len(v) for v in latencies.values())
+    result = {
+        "mode": args.mode,
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "turns": turns,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(turns / elapsed, 1) if elapsed else 0.0,
+        "memory_per_session_kib": round(memory_per_session / 1024, 1),
+        "states": {
+            state: {
+                "turns": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+            for state, values in sorted(latencies.items())
+        },
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return result
+
+    print(f"{args.sessions} sessions, {turns} turns in {elapsed:.2f}s ({result['turns_per_s']} turns/s), "
+          f"mode={args.mode}, concurrency={args.concurrency}")
+    print(f"{'state':<22}{'turns':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for state, stats in result["states"].items():
+        print(f"{state:<22}{stats['turns']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    print(f"memory per session: {result['memory_per_session_kib']} KiB")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=20, help="distinct user ids the sessions are spread over")
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per fake LLM call")
+    parser.add_argument("--search-latency", type=float, default=0.02, help="seconds per fixture search")
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--store", choices=["sqlite", "memory"], default="sqlite")
+    parser.add_argument("--memory-sessions", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's own console and log output")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="foodbot-bench-") as workdir:
+        configure_environment(args, workdir)
+        from models import KnowledgeGraph
+
+        knowledge_graph = KnowledgeGraph()
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        if not args.verbose:
+            # Injected search errors would otherwise log a warning per failed query
+            logging.disable(logging.WARNING)
+        with quiet:
+            latencies, elapsed = run_load(args, knowledge_graph)
+            memory_per_session = measure_memory(args, knowledge_graph)
+        return report(latencies, elapsed, memory_per_session, args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries go stale after `ttl` seconds.
+
+    Stale entries are not dropped eagerly: `get` ignores them, but `get_stale`
+    can still return them as a fallback when the upstream source is failing.
+    They are evicted in LRU order like any other entry once `maxsize` is hit.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 900):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry):
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Return a cached value even if it has expired"""
+        with self._lock:
+            entry = self._data.get(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _expired(self, entry) -> bool:
+        return self.ttl is not None and time.monotonic() - entry[1] > self.ttl
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class PersistentCache:
+    """JSON value cache with an in-memory LRU in front of a SQLite table.
+
+    Values survive restarts and are shared by every worker using the same
+    database file. With `ttl=None` entries never expire.
+    """
+
+    def __init__(self, path: str, table: str, maxsize: int = 256, ttl: Optional[float] = None):
+        self.table = table
+        self.ttl = ttl
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._memory.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return default
+        if self.ttl is not None and time.time() - row[1] > self.ttl:
+            self.delete(key)
+            return default
+        value = json.loads(row[0])
+        self._memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._memory.set(key, value)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+
+    def delete(self, key: str):
+        self._memory.pop(key)
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
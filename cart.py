@@ -0,0 +1,79 @@
+from typing import Iterator, Optional
+
+from matcher import FuzzyMatcher
+from models import CartItem, MenuItem
+from utils import normalize
+
+
+class Cart:
+    """Cart lines keyed by dish, with a running subtotal in integer cents.
+
+    Adding a dish that is already in the cart merges the quantities, so every
+    operation and the total are O(1) regardless of how the cart was built.
+    """
+
+    __slots__ = ("_lines", "_subtotal_cents", "_matcher")
+
+    def __init__(self):
+        self._lines = {}  # normalized dish name -> CartItem, in the order first added
+        self._subtotal_cents = 0
+        self._matcher = None
+
+    def add(self, item: MenuItem, quantity: int = 1) -> CartItem:
+        if not isinstance(quantity, int) or quantity < 1:
+            raise ValueError(f"Quantity must be a positive integer, got {quantity!r}")
+        key = normalize(item.name)
+        line = self._lines.get(key)
+        if line is None:
+            line = self._lines[key] = CartItem(item, 0)
+            self._matcher = None
+        line.quantity += quantity
+        self._subtotal_cents += line.unit_cents * quantity
+        return line
+
+    def remove(self, item: MenuItem, quantity: int = 1) -> int:
+        """Remove up to `quantity` of a dish; returns how many were actually removed"""
+        key = normalize(item.name)
+        line = self._lines.get(key)
+        if line is None:
+            return 0
+        removed = min(quantity, line.quantity)
+        line.quantity -= removed
+        self._subtotal_cents -= line.unit_cents * removed
+        if line.quantity <= 0:
+            del self._lines[key]
+            self._matcher = None
+        return removed
+
+    def get(self, name: str) -> Optional[CartItem]:
+        return self._lines.get(normalize(name))
+
+    def match(self, name: str, cutoff: float = 0.6) -> Optional[CartItem]:
+        """Exact line lookup, falling back to the closest dish name in the cart"""
+        line = self.get(name)
+        if line is None and self._lines:
+            if self._matcher is None:
+                self._matcher = FuzzyMatcher(self._lines)
+            close = self._matcher.best(name, cutoff=cutoff)
+            if close:
+                line = self._lines[close]
+        return line
+
+    def clear(self):
+        self._lines.clear()
+        self._subtotal_cents = 0
+        self._matcher = None
+
+    @property
+    def subtotal_cents(self) -> int:
+        return self._subtotal_cents
+
+    @property
+    def total(self) -> float:
+        return self._subtotal_cents / 100
+
+    def __iter__(self) -> Iterator[CartItem]:
+        return iter(self._lines.values())
+
+    def __len__(self):
+        return len(self._lines)
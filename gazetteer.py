@@ -0,0 +1,164 @@
+import json
+import os
+import re
+from typing import List, Optional
+
+from matcher import FuzzyMatcher
+from utils import normalize
+
+
+# Places we resolve locally instead of asking the LLM. More specific kinds win
+# when a message mentions several places, e.g. "Koramangala, Bengaluru".
+KIND_PRIORITY = {"landmark": 0, "area": 1, "city": 2}
+
+PLACES = [
+    # Bengaluru
+    {"location": "Koramangala, Bengaluru, India", "ll": "12.9352,77.6245", "kind": "area", "aliases": ["koramangala"]},
+    {"location": "Indiranagar, Bengaluru, India", "ll": "12.9784,77.6408", "kind": "area", "aliases": ["indiranagar", "indira nagar"]},
+    {"location": "HSR Layout, Bengaluru, India", "ll": "12.9121,77.6446", "kind": "area", "aliases": ["hsr layout", "hsr"]},
+    {"location": "Whitefield, Bengaluru, India", "ll": "12.9698,77.7500", "kind": "area", "aliases": ["whitefield"]},
+    {"location": "Jayanagar, Bengaluru, India", "ll": "12.9299,77.5826", "kind": "area", "aliases": ["jayanagar", "jaya nagar"]},
+    {"location": "JP Nagar, Bengaluru, India", "ll": "12.9063,77.5857", "kind": "area", "aliases": ["jp nagar", "j p nagar"]},
+    {"location": "BTM Layout, Bengaluru, India", "ll": "12.9166,77.6101", "kind": "area", "aliases": ["btm layout", "btm"]},
+    {"location": "Electronic City, Bengaluru, India", "ll": "12.8452,77.6602", "kind": "area", "aliases": ["electronic city", "ecity"]},
+    {"location": "MG Road, Bengaluru, India", "ll": "12.9756,77.6066", "kind": "area", "aliases": ["mg road", "mahatma gandhi road"]},
+    {"location": "Marathahalli, Bengaluru, India", "ll": "12.9591,77.6974", "kind": "area", "aliases": ["marathahalli"]},
+    {"location": "Bellandur, Bengaluru, India", "ll": "12.9304,77.6784", "kind": "area", "aliases": ["bellandur"]},
+    {"location": "Malleshwaram, Bengaluru, India", "ll": "13.0031,77.5643", "kind": "area", "aliases": ["malleshwaram", "malleswaram"]},
+    {"location": "Hebbal, Bengaluru, India", "ll": "13.0358,77.5970", "kind": "area", "aliases": ["hebbal"]},
+    {"location": "Yelahanka, Bengaluru, India", "ll": "13.1007,77.5963", "kind": "area", "aliases": ["yelahanka"]},
+    {"location": "Banashankari, Bengaluru, India", "ll": "12.9255,77.5468", "kind": "area", "aliases": ["banashankari"]},
+    {"location": "Rajajinagar, Bengaluru, India", "ll": "12.9913,77.5521", "kind": "area", "aliases": ["rajajinagar"]},
+    {"location": "Kempegowda International Airport, Bengaluru, India", "ll": "13.1986,77.7066", "kind": "landmark",
+     "aliases": ["kempegowda international airport", "kempegowda airport", "bengaluru airport", "bangalore airport", "blr airport"]},
+    # Cities
+    {"location": "Bengaluru, Karnataka, India", "ll": "12.9716,77.5946", "kind": "city", "aliases": ["bengaluru", "bangalore", "blr"]},
+    {"location": "Mumbai, Maharashtra, India", "ll": "19.0760,72.8777", "kind": "city", "aliases": ["mumbai", "bombay"]},
+    {"location": "New Delhi, Delhi, India", "ll": "28.6139,77.2090", "kind": "city", "aliases": ["new delhi", "delhi"]},
+    {"location": "Chennai, Tamil Nadu, India", "ll": "13.0827,80.2707", "kind": "city", "aliases": ["chennai", "madras"]},
+    {"location": "Hyderabad, Telangana, India", "ll": "17.3850,78.4867", "kind": "city", "aliases": ["hyderabad"]},
+    {"location": "Kolkata, West Bengal, India", "ll": "22.5726,88.3639", "kind": "city", "aliases": ["kolkata", "calcutta"]},
+    {"location": "Pune, Maharashtra, India", "ll": "18.5204,73.8567", "kind": "city", "aliases": ["pune"]},
+    {"location": "Ahmedabad, Gujarat, India", "ll": "23.0225,72.5714", "kind": "city", "aliases": ["ahmedabad"]},
+    {"location": "Jaipur, Rajasthan, India", "ll": "26.9124,75.7873", "kind": "city", "aliases": ["jaipur"]},
+    {"location": "Amsterdam, Netherlands", "ll": "52.3676,4.9041", "kind": "city", "aliases": ["amsterdam"]},
+    {"location": "London, United Kingdom", "ll": "51.5074,-0.1278", "kind": "city", "aliases": ["london"]},
+    {"location": "New York, NY, USA", "ll": "40.7128,-74.0060", "kind": "city", "aliases": ["new york", "new york city", "nyc"]},
+    {"location": "San Francisco, CA, USA", "ll": "37.7749,-122.4194", "kind": "city", "aliases": ["san francisco", "sf"]},
+    {"location": "Singapore", "ll": "1.3521,103.8198", "kind": "city", "aliases": ["singapore"]},
+    {"location": "Dubai, United Arab Emirates", "ll": "25.2048,55.2708", "kind": "city", "aliases": ["dubai"]},
+]
+
+# Leading phrases people wrap their location in ("I live in ...", "I'm near ...")
+FILLER_PREFIX = re.compile(
+    r"^(?:(?:i|we) (?:live|stay|am|are)|im|i m|were|my location is|deliver to|send it to|its)?\s*"
+    r"(?:in|at|near|around|close to|next to)?\s+"
+)
+
+# Words that may sit next to an area name without naming another place ("Koramangala 5th block")
+ADDRESS_WORDS = {"and", "the", "area", "block", "stage", "phase", "sector", "main", "cross", "road", "street",
+                 "layout", "nagar", "near", "side", "east", "west", "north", "south", "somewhere"}
+
+MAX_NGRAM = 4
+FUZZY_CUTOFF = 0.85
+FUZZY_MIN_LENGTH = 5
+
+
+def _load_places() -> List[dict]:
+    places = list(PLACES)
+    # Deployments can extend the gazetteer with a JSON list of entries in the same shape
+    extra_path = os.getenv("GAZETTEER_PATH")
+    if extra_path and os.path.exists(extra_path):
+        with open(extra_path) as f:
+            places.extend(json.load(f))
+    return places
+
+
+def _build_index(places: List[dict]) -> dict:
+    index = {}
+    for place in places:
+        aliases = place.get("aliases", []) + [place["location"].split(",")[0]]
+        for alias in aliases:
+            index.setdefault(normalize(alias), place)
+    return index
+
+
+_alias_index = _build_index(_load_places())
+# Every word of every known location ("india", "karnataka", ...) may appear alongside an area
+_location_words = {word for place in _alias_index.values() for word in normalize(place["location"]).split()}
+_alias_matcher = FuzzyMatcher(_alias_index)
+
+
+def _candidates(text: str) -> List[str]:
+    """All word n-grams of the message, longest first"""
+    tokens = text.split()
+    grams = []
+    for n in range(min(MAX_NGRAM, len(tokens)), 0, -1):
+        grams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return grams
+
+
+def _city(place: dict) -> str:
+    """City a place belongs to: the first part of a city's location, the second of an area's or landmark's"""
+    parts = [part.strip() for part in place["location"].split(",")]
+    if place.get("kind") == "city" or len(parts) < 2:
+        return parts[0]
+    return parts[1]
+
+
+def _unknown_words(text: str, aliases: List[str]) -> List[str]:
+    """Words of `text` that are not part of a matched alias, a known location or an address"""
+    for alias in sorted(aliases, key=len, reverse=True):
+        text = re.sub(rf"\b{re.escape(alias)}\b", " ", text)
+    return [word for word in text.split()
+            if word not in _location_words and word not in ADDRESS_WORDS and not word[0].isdigit()]
+
+
+def _rank(place: dict, alias: str) -> tuple:
+    return KIND_PRIORITY.get(place.get("kind"), len(KIND_PRIORITY)), -len(alias)
+
+
+def lookup(user_message: str) -> Optional[dict]:
+    """Resolve a location message to {"location", "ll"} without the LLM, if we can"""
+    text = normalize(user_message)
+    if not text:
+        return None
+    stripped = FILLER_PREFIX.sub("", text, count=1).strip() or text
+
+    # 1. Whole message is a known place
+    place = _alias_index.get(stripped)
+
+    # 2. Message mentions known places; prefer the most specific one
+    if place is None:
+        hits = [(alias, _alias_index[alias]) for alias in _candidates(text) if alias in _alias_index]
+        cities = {_city(p) for _, p in hits if p.get("kind") == "city"}
+        if cities:
+            # "MG Road, Pune": an area is only trusted if it lies in the city the user named
+            consistent = [(alias, p) for alias, p in hits if p.get("kind") == "city" or _city(p) in cities]
+            if any(p.get("kind") != "city" for _, p in hits) and all(p.get("kind") == "city" for _, p in consistent):
+                return None
+            hits = consistent
+        if hits:
+            place = min(hits, key=lambda hit: _rank(hit[1], hit[0]))[1]
+            if _unknown_words(stripped, [a for a, _ in hits]):
+                # The rest may name a place we don't know: a city ("Jayanagar, Mysore") or
+                # an area the LLM should keep ("Andheri West, Mumbai")
+                return None
+
+    # 3. Typos ("koramangla"): closest alias to any n-gram of the message
+    if place is None:
+        scored = []
+        for gram in _candidates(stripped):
+            if len(gram) < FUZZY_MIN_LENGTH:
+                continue
+            for alias, score in _alias_matcher.search(gram, limit=3, cutoff=FUZZY_CUTOFF):
+                candidate = _alias_index[alias]
+                scored.append((-score, _rank(candidate, alias), candidate, gram))
+        if scored:
+            _, _, place, gram = min(scored, key=lambda s: s[:2])
+            if _unknown_words(stripped, [gram]):
+                return None
+
+    if place is None:
+        return None
+    return {"location": place["location"], "ll": place["ll"]}
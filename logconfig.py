@@ -0,0 +1,127 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Optional
+
+from prompts import LOG_LEVEL, LOG_LEVELS
+
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(session)s] %(message)s"
+
+# Session id of the chat turn being handled, for log records and per-session debugging
+current_session: ContextVar[str] = ContextVar("current_session", default="-")
+
+_debug_sessions = set()
+_levels: Dict[str, int] = {}  # configured level per logger name ("" is the root)
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """"agent=DEBUG,httpx=WARNING" -> {"agent": 10, "httpx": 30}"""
+    levels = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, level = part.partition("=")
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+class SessionFilter(logging.Filter):
+    """Tags records with the current session and enforces the configured levels.
+
+    While some session has debug logging on, loggers are opened up to DEBUG;
+    this filter then drops the extra records unless they belong to one of
+    the debugging sessions.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.session = current_session.get()
+        if record.levelno >= _configured_level(record.name):
+            return True
+        return record.session in _debug_sessions
+
+
+def _configured_level(name: str) -> int:
+    while name:
+        if name in _levels:
+            return _levels[name]
+        name = name.rpartition(".")[0]
+    return _levels.get("", logging.WARNING)
+
+
+def setup_logging(level: str = LOG_LEVEL, module_levels: str = LOG_LEVELS):
+    """Route all logging through a queue so request threads never block on I/O.
+
+    Records are handed to a QueueHandler and written to stderr by a
+    QueueListener thread. `module_levels` sets per-logger levels on top of
+    the root `level`.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        _levels.clear()
+        _levels[""] = logging.getLevelName(level.upper())
+        _levels.update(parse_levels(module_levels))
+
+        log_queue = queue.SimpleQueue()
+        stream = logging.StreamHandler()
+        stream.setFormatter(logging.Formatter(LOG_FORMAT))
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(SessionFilter())
+        root = logging.getLogger()
+        root.handlers[:] = [queue_handler]
+        _apply_levels()
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def _apply_levels():
+    debugging = bool(_debug_sessions)
+    for name, level in _levels.items():
+        logging.getLogger(name or None).setLevel(logging.DEBUG if debugging else level)
+
+
+def set_session_debug(session_id: str, enabled: bool = True):
+    """Turn DEBUG logging on or off for one session only"""
+    with _lock:
+        if enabled:
+            _debug_sessions.add(session_id)
+        else:
+            _debug_sessions.discard(session_id)
+        _apply_levels()
+
+
+def session_debug_enabled(session_id: str) -> bool:
+    return session_id in _debug_sessions
+
+
+@contextmanager
+def session_context(session_id: str):
+    """Attribute log records emitted inside the block to `session_id`"""
+    token = current_session.set(session_id)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+async def iterate_in_session(session_id: str, stream: AsyncIterator):
+    """Re-yield `stream` with `session_id` set while each step runs.
+
+    Gradio may resume a generator handler from a different context, so the
+    session is set around every step instead of once for the whole stream.
+    """
+    while True:
+        with session_context(session_id):
+            try:
+                item = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+        yield item
@@ -0,0 +1,102 @@
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from utils import normalize
+
+
+def trigrams(text: str) -> set:
+    """Character trigrams of a normalized string, padded so short words still produce some"""
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_edit_distance(a: str, b: str, max_dist: int) -> int:
+    """Edit distance counting insertions, deletions, substitutions and adjacent
+    transpositions ("pizaz" -> "pizza" is 1), giving up once it must exceed `max_dist`.
+
+    Returns max_dist + 1 when the strings are further apart than that. Only a
+    diagonal band of width 2 * max_dist + 1 is computed, so the cost is
+    O(len * max_dist) rather than O(len_a * len_b).
+    """
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    if len(a) > len(b):
+        a, b = b, a
+    too_far = max_dist + 1
+    before_previous = None
+    previous = [j if j <= max_dist else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        lo = max(1, i - max_dist)
+        hi = min(len(b), i + max_dist)
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= max_dist else too_far
+        row_min = current[0]
+        for j in range(lo, hi + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current[j] = value if value <= max_dist else too_far
+            row_min = min(row_min, current[j])
+        if row_min > max_dist:
+            return too_far
+        before_previous, previous = previous, current
+    return previous[len(b)]
+
+
+class FuzzyMatcher:
+    """Ranked fuzzy lookup over a fixed set of names.
+
+    Candidates are found through a trigram inverted index, so only names that
+    share some trigram with the query are scored at all. Each candidate gets the
+    better of its trigram Dice coefficient and its edit-distance similarity
+    (both 0..1); the edit distance is only computed for the best few and is
+    bounded by what the cutoff still allows.
+    """
+
+    def __init__(self, names: Iterable[str], rescore: int = 20):
+        self.names = [normalize(name) for name in names]
+        self.rescore = rescore
+        self._grams = [trigrams(name) for name in self.names]
+        self._index = defaultdict(list)
+        for i, grams in enumerate(self._grams):
+            for gram in grams:
+                self._index[gram].append(i)
+        self._exact = {name: i for i, name in enumerate(self.names)}
+
+    def search(self, query: str, limit: int = 5, cutoff: float = 0.5) -> List[Tuple[str, float]]:
+        """Return up to `limit` (name, score) pairs with score >= cutoff, best first"""
+        query = normalize(query)
+        if not query:
+            return []
+        if query in self._exact:
+            return [(query, 1.0)]
+
+        query_grams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for i in self._index.get(gram, ()):
+                shared[i] += 1
+
+        dice = {i: 2 * count / (len(query_grams) + len(self._grams[i])) for i, count in shared.items()}
+        shortlist = sorted(dice, key=dice.get, reverse=True)[:max(self.rescore, limit)]
+
+        results = []
+        for i in shortlist:
+            name = self.names[i]
+            longest = max(len(name), len(query))
+            max_dist = int((1 - cutoff) * longest)
+            distance = bounded_edit_distance(query, name, max_dist)
+            similarity = 1 - distance / longest if distance <= max_dist else 0.0
+            score = max(dice[i], similarity)
+            if score >= cutoff:
+                results.append((name, round(score, 4)))
+        results.sort(key=lambda result: result[1], reverse=True)
+        return results[:limit]
+
+    def best(self, query: str, cutoff: float = 0.5) -> Optional[str]:
+        results = self.search(query, limit=1, cutoff=cutoff)
+        return results[0][0] if results else None
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,87 @@
+from collections import deque
+from typing import List, Optional, Tuple
+
+from prompts import MEMORY_COMPACT_CHARS, MEMORY_MAX_BYTES, MEMORY_MAX_TOKENS, MEMORY_MAX_TURNS
+from utils import estimate_tokens
+
+
+class ConversationMemory:
+    """Recent chat turns, bounded by turn count, estimated tokens and bytes.
+
+    Each turn is stored as (user message, assistant reply). Callers replace
+    large payloads with a short reference before storing them (the agent
+    turns a menu into "[menu for X: 12 items]"), and anything still longer
+    than `compact_chars` is truncated. When a new turn pushes the
+    session over a budget, whole turns are dropped oldest first, so the
+    stored history itself stays bounded, not just the view of it.
+    """
+
+    __slots__ = ("max_turns", "max_tokens", "max_bytes", "compact_chars", "_turns", "_tokens", "_bytes")
+
+    def __init__(
+        self,
+        max_turns: int = MEMORY_MAX_TURNS,
+        max_tokens: int = MEMORY_MAX_TOKENS,
+        max_bytes: int = MEMORY_MAX_BYTES,
+        compact_chars: int = MEMORY_COMPACT_CHARS,
+    ):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_bytes = max_bytes
+        self.compact_chars = compact_chars
+        self._turns = deque()  # (user, assistant, tokens, bytes), oldest first
+        self._tokens = 0
+        self._bytes = 0
+
+    def add_turn(self, message: str, response: str):
+        """Store one exchange, evicting the oldest ones if it goes over budget"""
+        message = self._compact(message)
+        response = self._compact(response)
+        tokens = estimate_tokens(message) + estimate_tokens(response)
+        size = len(message.encode()) + len(response.encode())
+        self._turns.append((message, response, tokens, size))
+        self._tokens += tokens
+        self._bytes += size
+        while self._turns and (
+            len(self._turns) > self.max_turns or self._tokens > self.max_tokens or self._bytes > self.max_bytes
+        ):
+            _, _, tokens, size = self._turns.popleft()
+            self._tokens -= tokens
+            self._bytes -= size
+
+    def _compact(self, text: str) -> str:
+        text = text.strip()
+        if len(text) <= self.compact_chars:
+            return text
+        return f"{text[:self.compact_chars]}… [{len(text) - self.compact_chars} chars omitted]"
+
+    @property
+    def turns(self) -> List[Tuple[str, str]]:
+        return [(message, response) for message, response, _, _ in self._turns]
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def render(self, max_tokens: Optional[int] = None) -> str:
+        """The most recent turns as "User: ...\\nAssistant: ..." text, within `max_tokens`"""
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        lines = []
+        for message, response, tokens, _ in reversed(self._turns):
+            if tokens > budget:
+                break
+            budget -= tokens
+            lines.append(f"User: {message}\nAssistant: {response}")
+        return "\n".join(reversed(lines))
+
+    def clear(self):
+        self._turns.clear()
+        self._tokens = 0
+        self._bytes = 0
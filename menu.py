@@ -0,0 +1,141 @@
+import logging
+import re
+from dataclasses import asdict
+from typing import List, Optional
+
+from matcher import FuzzyMatcher
+from models import MenuItem
+from utils import normalize
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_menu_line(line: str) -> Optional[MenuItem]:
+    """Parse one `Dish Name | Price | Category | Description` line, or None if it isn't one"""
+    line = line.strip()
+    if not line or line.lower().startswith("dish name") or line.count("|") != 3:
+        return None
+    try:
+        raw_name, price, category, desc = [part.strip() for part in line.split("|")]
+        # Remove numbering/bullet prefix like "1. " from dish name
+        name = re.sub(r"^[•\-\d\. ]+", "", raw_name)
+        price_float = float(price.replace("$", "").strip())
+        return MenuItem(name=name, price=price_float, description=desc, category=category)
+    except Exception as e:
+        logger.warning("menu_line_unparsed line=%r error=%s", line, e)
+        return None
+
+
+def parse_menu(menu_text: str) -> List[MenuItem]:
+    """Parse `Dish Name | Price | Category | Description` lines into MenuItem objects"""
+    return [item for item in map(parse_menu_line, menu_text.split("\n")) if item is not None]
+
+
+class MenuStreamParser:
+    """Parses menu lines as a completion streams in, one chunk at a time"""
+
+    def __init__(self):
+        self.items: List[MenuItem] = []
+        self.raw_text = ""
+        self._pending = ""
+
+    def feed(self, chunk: str) -> List[MenuItem]:
+        """Add a chunk of completion text; returns the items whose lines it completed"""
+        self.raw_text += chunk
+        lines = (self._pending + chunk).split("\n")
+        self._pending = lines.pop()
+        return self._parse(lines)
+
+    def close(self) -> List[MenuItem]:
+        """Parse whatever is left after the last newline"""
+        pending, self._pending = self._pending, ""
+        return self._parse([pending])
+
+    def _parse(self, lines: List[str]) -> List[MenuItem]:
+        parsed = [item for item in map(parse_menu_line, lines) if item is not None]
+        self.items.extend(parsed)
+        return parsed
+
+
+def format_menu(restaurant_name: str, items: List[MenuItem]) -> str:
+    result = f"🍽️ Menu for {restaurant_name}:\n\n"
+
+    categories = {}
+    for item in items:
+        categories.setdefault(item.category, []).append(item)
+
+    for cat, cat_items in categories.items():
+        result += f"📂 {cat}\n"
+        for item in cat_items:
+            result += f"   • {item.name} - ${item.price:.2f}\n"
+            result += f"     {item.description}\n\n"
+
+    result += "💡 To add items to your cart, say something like:\n"
+    result += "   'Add 2 Margherita Pizza' or 'I want the Caesar Salad'"
+    return result
+
+
+class Menu:
+    """A restaurant menu parsed once, with lookup indexes for cart extraction"""
+
+    def __init__(self, restaurant_name: str, items: List[MenuItem], raw_text: str = "", text: str = ""):
+        self.restaurant_name = restaurant_name
+        self.items = items
+        self.raw_text = raw_text
+        # normalized dish name -> item, and a trigram index over those names
+        self._by_name = {normalize(item.name): item for item in items}
+        self._matcher = FuzzyMatcher(self._by_name)
+        self.text = text or format_menu(restaurant_name, items)
+        self._compact_text = None
+
+    @classmethod
+    def from_llm_text(cls, restaurant_name: str, raw_text: str) -> "Menu":
+        return cls(restaurant_name, parse_menu(raw_text), raw_text=raw_text)
+
+    @classmethod
+    def from_dict(cls, restaurant_name: str, data: dict) -> "Menu":
+        items = [MenuItem(**item) for item in data["items"]]
+        return cls(restaurant_name, items, raw_text=data.get("raw", ""), text=data.get("formatted", ""))
+
+    def to_dict(self) -> dict:
+        return {
+            "formatted": self.text,
+            "raw": self.raw_text,
+            "items": [asdict(item) for item in self.items],
+        }
+
+    @property
+    def compact_text(self) -> str:
+        """One "id: dish name" line per item, the smallest menu an LLM can pick from"""
+        if self._compact_text is None:
+            self._compact_text = "\n".join(f"{i}: {item.name}" for i, item in enumerate(self.items, 1))
+        return self._compact_text
+
+    def by_id(self, item_id) -> Optional[MenuItem]:
+        """Item for an id from `compact_text`, or None if it isn't one"""
+        try:
+            index = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        return self.items[index - 1] if 1 <= index <= len(self.items) else None
+
+    def get(self, name: str) -> Optional[MenuItem]:
+        """Exact lookup by dish name, ignoring case and punctuation"""
+        return self._by_name.get(normalize(name))
+
+    def match(self, name: str, cutoff: float = 0.5) -> Optional[MenuItem]:
+        """Exact lookup, falling back to the closest dish name"""
+        item = self.get(name)
+        if item is None:
+            close = self._matcher.best(name, cutoff=cutoff)
+            if close:
+                item = self._by_name[close]
+        return item
+
+    def search(self, name: str, limit: int = 5, cutoff: float = 0.5) -> List[tuple]:
+        """Ranked (MenuItem, score) candidates for a dish name"""
+        return [(self._by_name[key], score) for key, score in self._matcher.search(name, limit=limit, cutoff=cutoff)]
+
+    def __len__(self):
+        return len(self.items)
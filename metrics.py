@@ -0,0 +1,266 @@
+import bisect
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+from prompts import PROFILE_INTERVAL
+from utils import estimate_tokens
+
+
+# Seconds; covers everything from a dict lookup to a slow LLM completion
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Estimated prompt tokens
+TOKEN_BUCKETS = (50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n" + "".join(self._samples())
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic count, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{self._labels(key)} {value}\n"
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram in the Prometheus exposition format"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[-1] if series else 0
+
+    def _samples(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{self._labels(key, le)} {cumulative}\n"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{self._labels(key, le)} {values[-1]}\n"
+            yield f"{self.name}_sum{self._labels(key)} {values[-2]}\n"
+            yield f"{self.name}_count{self._labels(key)} {values[-1]}\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = []
+
+TURN_SECONDS = Histogram("foodbot_turn_seconds", "Time to answer a chat turn, by conversation state", ["state"])
+STAGE_SECONDS = Histogram("foodbot_stage_seconds", "Time spent in one step of a turn (LLM call, search, parse, match)", ["stage"])
+CACHE_LOOKUPS = Counter("foodbot_cache_lookups_total", "Cache lookups by cache and result (hit, miss, stale)", ["cache", "result"])
+LLM_TOKENS = Counter("foodbot_llm_tokens_total", "LLM tokens by purpose and direction (input, output)", ["purpose", "direction"])
+PROMPT_TOKENS = Histogram("foodbot_prompt_tokens", "Estimated prompt tokens per LLM call, by purpose", ["purpose"],
+                          buckets=TOKEN_BUCKETS)
+FALLBACKS = Counter("foodbot_fallbacks_total", "Times a cheaper path gave up and a fallback was used", ["reason"])
+
+
+@contextmanager
+def span(stage: str):
+    """Time the `with` block into foodbot_stage_seconds{stage=...}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+@contextmanager
+def timed_turn(state: str):
+    """Time a whole chat turn into foodbot_turn_seconds{state=...}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        TURN_SECONDS.observe(time.perf_counter() - started, state=state)
+
+
+def record_llm_usage(response, purpose: str):
+    """Count the tokens an LLM response reports in its usage_metadata, if any"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_TOKENS.inc(usage.get("input_tokens", 0), purpose=purpose, direction="input")
+        LLM_TOKENS.inc(usage.get("output_tokens", 0), purpose=purpose, direction="output")
+
+
+def record_prompt(prompt: str, purpose: str) -> str:
+    """Observe a prompt's estimated token count before it is sent; returns the prompt unchanged"""
+    PROMPT_TOKENS.observe(estimate_tokens(prompt), purpose=purpose)
+    return prompt
+
+
+def render_metrics() -> str:
+    return "".join(metric.render() for metric in REGISTRY)
+
+
+class SamplingProfiler:
+    """Statistical profiler that can be switched on and off while the app runs.
+
+    A background thread snapshots every thread's stack each `interval`
+    seconds and tallies them in collapsed-stack form ("a;b;c count"), which
+    flamegraph tools read directly. Nothing is hooked into the interpreter,
+    so the overhead is one stack walk per interval and zero when stopped.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._stacks = _Tally()
+        self._samples = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None):
+        with self._lock:
+            if self.running:
+                return
+            if interval:
+                self.interval = interval
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self._samples = 0
+
+    def collapsed(self, limit: int = 500) -> str:
+        with self._lock:
+            top = self._stacks.most_common(limit)
+            samples = self._samples
+        header = f"# {samples} samples every {self.interval * 1000:.1f} ms\n"
+        return header + "".join(f"{stack} {count}\n" for stack, count in top)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                self._samples += 1
+                for thread_id, frame in frames.items():
+                    if thread_id != own:
+                        self._stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+
+profiler = SamplingProfiler()
+
+
+def install(app, debug: bool = False):
+    """Serve /metrics on a FastAPI app, plus /debug/profile controls when `debug` is set"""
+    from fastapi import Response
+
+    @app.get("/metrics")
+    def metrics_endpoint():
+        return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+    if not debug:
+        return
+
+    @app.post("/debug/profile/start")
+    def profile_start(interval: Optional[float] = None):
+        profiler.start(interval)
+        return {"running": True, "interval": profiler.interval}
+
+    @app.post("/debug/profile/stop")
+    def profile_stop():
+        profiler.stop()
+        return {"running": False}
+
+    @app.post("/debug/profile/reset")
+    def profile_reset():
+        profiler.reset()
+        return {"reset": True}
+
+    @app.get("/debug/profile")
+    def profile_dump(limit: int = 500):
+        return Response(profiler.collapsed(limit), media_type="text/plain")
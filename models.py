@@ -1,6 +1,9 @@
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
+from contextlib import contextmanager
 from typing import List, Optional
 import pprint
+import threading
+from storage import GraphStore, default_store
 
 
 
@@ -11,6 +14,8 @@ class Restaurant:
     rating: float
     cuisine_type: str
     phone: str = ""
+    place_id: str = ""
+    reviews: int = 0
 
 @dataclass
 class MenuItem:
@@ -19,10 +24,19 @@ class MenuItem:
     description: str
     category: str
 
-@dataclass
+@dataclass(slots=True)
 class CartItem:
     item: MenuItem
     quantity: int
+    unit_cents: int = field(init=False)
+
+    def __post_init__(self):
+        # Prices are kept in integer cents so totals don't drift
+        self.unit_cents = round(self.item.price * 100)
+
+    @property
+    def line_cents(self) -> int:
+        return self.unit_cents * self.quantity
 
 @dataclass
 class UserProfile:
@@ -34,39 +48,77 @@ class UserProfile:
 
 
 class KnowledgeGraph:
-    def __init__(self):
-        self.users = {}
-        self.restaurants = {}
-        self.orders = {}
+    def __init__(self, store: Optional[GraphStore] = None):
+        self.store = store if store is not None else default_store()
+        # Bumped on every change made through this object; writes by other processes sharing the store don't bump it
+        self.version = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _changed(self):
+        if getattr(self._local, "batching", False):
+            # Inside batch(): bump once when the transaction commits
+            self._local.dirty = True
+            return
+        with self._lock:
+            self.version += 1
     
     def add_user(self, user_profile: UserProfile):
-        self.users[user_profile.user_id] = asdict(user_profile)
+        self.store.save_user(asdict(user_profile))
+        self._changed()
     
     def get_user(self, user_id: str) -> Optional[UserProfile]:
-        if user_id in self.users:
-            data = self.users[user_id]
+        data = self.store.load_user(user_id)
+        if data is not None:
             return UserProfile(**data)
         return None
     
     def update_user_preferences(self, user_id: str, cuisine: str, restaurant: str):
-        if user_id not in self.users:
-            self.users[user_id] = asdict(UserProfile(user_id, [], [], []))
-        
-        user_data = self.users[user_id]
-        if cuisine not in user_data['preferred_cuisines']:
-            user_data['preferred_cuisines'].append(cuisine)
-        if restaurant not in user_data['favorite_restaurants']:
-            user_data['favorite_restaurants'].append(restaurant)
-
-    def debug_view(self):
-        print("\n=== KNOWLEDGE GRAPH STATE ===")
-        print("📌 Users:")
-        pprint.pprint(self.users)
-        print("\n📌 Restaurants:")
-        pprint.pprint(self.restaurants)
-        print("\n📌 Orders:")
-        pprint.pprint(self.orders)
-        print("=============================\n")
-
-
-            
\ No newline at end of file
+        self.store.add_preferences(user_id, cuisine, restaurant)
+        self._changed()
+
+    def add_restaurant(self, restaurant: Restaurant):
+        self.store.save_restaurant(asdict(restaurant))
+
+    def add_order(self, order: dict):
+        self.store.save_order(order)
+        self._changed()
+
+    def get_orders(self, user_id: Optional[str] = None, since: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        return self.store.load_orders(user_id=user_id, since=since, limit=limit)
+
+    def summarize_orders(self, user_id: Optional[str] = None, since: Optional[str] = None,
+                         until: Optional[str] = None, restaurants: int = 10, offset: int = 0,
+                         dishes: int = 15, users: int = 5) -> dict:
+        """Aggregated, size-bounded order counts; see GraphStore.summarize_orders"""
+        return self.store.summarize_orders(user_id=user_id, since=since, until=until, restaurants=restaurants,
+                                           offset=offset, dishes=dishes, users=users)
+
+    @contextmanager
+    def batch(self):
+        """Commit the writes made inside the `with` block together"""
+        outermost = not getattr(self._local, "batching", False)
+        if outermost:
+            self._local.batching, self._local.dirty = True, False
+        try:
+            with self.store.batch():
+                yield
+        finally:
+            if outermost:
+                self._local.batching = False
+        if outermost and self._local.dirty:
+            self._changed()
+
+    def debug_view(self) -> str:
+        """Dump of the whole store. O(total history): only for the debug endpoint, never the hot path."""
+        snapshot = self.store.snapshot()
+        return "\n".join([
+            "=== KNOWLEDGE GRAPH STATE ===",
+            "📌 Users:",
+            pprint.pformat(snapshot["users"]),
+            "\n📌 Restaurants:",
+            pprint.pformat(snapshot["restaurants"]),
+            "\n📌 Orders:",
+            pprint.pformat(snapshot["orders"]),
+            "=============================",
+        ])
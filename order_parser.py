@@ -0,0 +1,135 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from menu import Menu
+from models import MenuItem
+from utils import normalize
+
+
+# Below this, the message goes to the LLM instead
+LOCAL_CONFIDENCE = 0.8
+# Two candidates this close to each other are treated as ambiguous
+AMBIGUITY_MARGIN = 0.05
+# How many "and"-separated pieces may be glued back together ("fish and chips")
+MAX_JOINED_SEGMENTS = 3
+
+QUANTITY_WORDS = {
+    "half a dozen": 6, "a couple of": 2, "a couple": 2, "couple of": 2, "a dozen": 12, "dozen": 12,
+    "a": 1, "an": 1, "one": 1, "single": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+_quantity_word = "|".join(sorted(QUANTITY_WORDS, key=len, reverse=True))
+
+SEPARATORS = re.compile(r"\s*(?:,|;|&|\+|\n|\band\b|\bplus\b|\balso\b)\s*")
+LEADING_INTENT = re.compile(
+    r"^(?:(?:please|pls|can|could|may|would|will|i|id|ill|im|we|you|us|me|just|also|like|love|to|"
+    r"want|wanna|need|get|give|have|add|order|take|lets|go|with)\s+)+"
+)
+TRAILING_INTENT = re.compile(r"(?:\s+(?:to|into|in|on)\s+(?:my|the|our)\s+(?:cart|order|basket)|\s+please|\s+as well|\s+too)+$")
+LEADING_QUANTITY = re.compile(rf"^(?:(\d+)\s*x?|x\s*(\d+)|({_quantity_word}))\s+")
+TRAILING_QUANTITY = re.compile(r"\s+(?:x\s*(\d+)|(\d+)\s*x)$")
+# Fractions and ranges ("1.5", "1/2", "2-3", "2 to 3"); normalize() would glue their digits into 15 / 12 / 23
+AMBIGUOUS_QUANTITY = re.compile(r"\d\s*[.,/]\s*\d|\d\s*(?:-|–|to)\s*\d")
+PORTION = re.compile(r"^(?:(?:more|of|the|some|orders?|plates?|portions?|servings?)\s+)+")
+
+
+@dataclass
+class ParsedOrder:
+    items: List[Tuple[MenuItem, int]] = field(default_factory=list)
+    unmatched: List[str] = field(default_factory=list)
+    confidence: float = 0.0
+
+    @property
+    def confident(self) -> bool:
+        return bool(self.items) and not self.unmatched and self.confidence >= LOCAL_CONFIDENCE
+
+
+def _split_quantity(text: str) -> Tuple[int, str]:
+    quantity = 1
+    match = LEADING_QUANTITY.match(text)
+    if match:
+        digits = match.group(1) or match.group(2)
+        quantity = int(digits) if digits else QUANTITY_WORDS[match.group(3)]
+        text = text[match.end():]
+    else:
+        match = TRAILING_QUANTITY.search(text)
+        if match:
+            quantity = int(match.group(1) or match.group(2))
+            text = text[:match.start()]
+    return quantity, PORTION.sub("", text).strip()
+
+
+def _singular(text: str) -> str:
+    words = []
+    for word in text.split():
+        if len(word) > 4 and word.endswith("es") and word[-3] in "sxz":
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(words)
+
+
+def _resolve(text: str, menu: Menu) -> Tuple[Optional[MenuItem], float]:
+    """Best menu item for a dish phrase, with a 0..1 confidence"""
+    if not text:
+        return None, 0.0
+    item = menu.get(text)
+    if item is not None:
+        return item, 1.0
+    item = menu.get(_singular(text))
+    if item is not None:
+        return item, 0.95
+    candidates = menu.search(text, limit=2)
+    if not candidates:
+        return None, 0.0
+    (item, score), rest = candidates[0], candidates[1:]
+    if rest and score - rest[0][1] < AMBIGUITY_MARGIN:
+        score = min(score, LOCAL_CONFIDENCE - 0.01)
+    return item, score
+
+
+def _clean(segment: str) -> str:
+    text = normalize(segment)
+    text = LEADING_INTENT.sub("", text)
+    return TRAILING_INTENT.sub("", text).strip()
+
+
+def parse_order(message: str, menu: Menu) -> ParsedOrder:
+    """Extract (item, quantity) pairs from an add message without calling the LLM.
+
+    Handles digits and quantity words ("2", "x2", "two", "a couple of"),
+    plurals, and lists separated by commas, "and", "&" or "plus". Pieces that
+    were split on "and" are glued back together when that names a dish
+    ("fish and chips"). Fractions, ranges and zero quantities are never
+    confident. `confident` tells the caller whether to trust it.
+    """
+    if AMBIGUOUS_QUANTITY.search(message):
+        # Read from the raw text; leave it to the LLM rather than guess
+        return ParsedOrder(unmatched=[message])
+    segments = [_clean(s) for s in SEPARATORS.split(message.lower())]
+    segments = [s for s in segments if s]
+    parsed = ParsedOrder(confidence=1.0 if segments else 0.0)
+
+    i = 0
+    while i < len(segments):
+        # Prefer the longest run of segments that names a dish exactly
+        for span in range(min(MAX_JOINED_SEGMENTS, len(segments) - i), 1, -1):
+            quantity, text = _split_quantity(" and ".join(segments[i:i + span]))
+            item, score = _resolve(text, menu)
+            if score >= 0.95:
+                break
+        else:
+            span = 1
+            quantity, text = _split_quantity(segments[i])
+            item, score = _resolve(text, menu)
+
+        if item is None or quantity < 1:
+            parsed.unmatched.append(text or segments[i])
+            parsed.confidence = 0.0
+        else:
+            parsed.items.append((item, quantity))
+            parsed.confidence = min(parsed.confidence, score)
+        i += span
+    return parsed
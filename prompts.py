@@ -4,8 +4,11 @@ import httpx
 import httpx
 
 import os
+import threading
+from typing import Callable, Optional
 from dotenv import load_dotenv
 from groq import Groq
+from langchain_groq import ChatGroq
 import httpx
 
 # Load environment variables from .env file
@@ -15,31 +18,124 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 SERP_API_KEY = os.getenv("SERP_API_KEY")
 
+# Logging and debug-only endpoints
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # per-module overrides, e.g. "agent=DEBUG,httpx=WARNING"
+DEBUG_ENDPOINTS = os.getenv("FOODBOT_DEBUG", "0") == "1"
+
+# Chat turns Gradio runs at once across all sessions (0 = no limit)
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", "64")) or None
+
+# Restaurant search results cache
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))  # seconds
+
+# SerpAPI client: timeouts in seconds, retries per call, circuit breaker opens after N failed calls
+SERP_TIMEOUT = float(os.getenv("SERP_TIMEOUT", "8"))
+SERP_CONNECT_TIMEOUT = float(os.getenv("SERP_CONNECT_TIMEOUT", "3"))
+SERP_MAX_RETRIES = int(os.getenv("SERP_MAX_RETRIES", "2"))
+SERP_MAX_CONNECTIONS = int(os.getenv("SERP_MAX_CONNECTIONS", "20"))
+SERP_BREAKER_THRESHOLD = int(os.getenv("SERP_BREAKER_THRESHOLD", "5"))
+SERP_BREAKER_RESET = float(os.getenv("SERP_BREAKER_RESET", "30"))
+
+# Search backend: "serpapi", or "fixture" to replay recorded responses offline (load tests, benchmarks)
+SEARCH_PROVIDER = os.getenv("SEARCH_PROVIDER", "serpapi")
+SEARCH_FIXTURES_DIR = os.getenv("SEARCH_FIXTURES_DIR", os.path.join(os.path.dirname(__file__), "fixtures", "search"))
+SEARCH_FIXTURE_LATENCY = float(os.getenv("SEARCH_FIXTURE_LATENCY", "0"))  # seconds per call
+SEARCH_FIXTURE_JITTER = float(os.getenv("SEARCH_FIXTURE_JITTER", "0"))
+SEARCH_FIXTURE_ERROR_RATE = float(os.getenv("SEARCH_FIXTURE_ERROR_RATE", "0"))  # 0..1
+SEARCH_FIXTURE_SEED = int(os.getenv("SEARCH_FIXTURE_SEED", "0"))
+
+# Normalized locations returned by the LLM
+LOCATION_CACHE_PATH = os.getenv("LOCATION_CACHE_PATH", "location_cache.db")
+LOCATION_CACHE_SIZE = int(os.getenv("LOCATION_CACHE_SIZE", "4096"))
+
+# Generated menus, persisted so repeat selections skip the LLM
+MENU_CACHE_PATH = os.getenv("MENU_CACHE_PATH", "menu_cache.db")
+MENU_CACHE_SIZE = int(os.getenv("MENU_CACHE_SIZE", "512"))
+MENU_CACHE_TTL = int(os.getenv("MENU_CACHE_TTL", "0")) or None  # seconds, 0 = never expire
+# Menus generated in the background for the restaurants shown to the user
+MENU_PREFETCH_COUNT = int(os.getenv("MENU_PREFETCH_COUNT", "3"))
+MENU_PREFETCH_WORKERS = int(os.getenv("MENU_PREFETCH_WORKERS", "4"))
+MENU_PREFETCH_QUEUE = int(os.getenv("MENU_PREFETCH_QUEUE", "8"))  # prefetches waiting for a worker
+
+# Per-session conversation memory budgets; the oldest turns are dropped first
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "10"))
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "2000"))
+MEMORY_MAX_BYTES = int(os.getenv("MEMORY_MAX_BYTES", "16384"))
+MEMORY_COMPACT_CHARS = int(os.getenv("MEMORY_COMPACT_CHARS", "400"))  # longer replies are truncated
+MEMORY_PROMPT_TOKENS = int(os.getenv("MEMORY_PROMPT_TOKENS", "200"))  # history sent with cart extraction
+
+# Seconds between stack samples while the runtime profiler is on (FOODBOT_DEBUG only)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Knowledge graph image rendering
+KG_RENDER_WORKERS = int(os.getenv("KG_RENDER_WORKERS", "2"))
+KG_RENDER_CONCURRENCY = int(os.getenv("KG_RENDER_CONCURRENCY", "16")) or None  # graph requests Gradio runs at once
+KG_RENDER_TTL = float(os.getenv("KG_RENDER_TTL", "60"))  # seconds; bounds staleness from other workers' writes
+
 # http_client = httpx.Client()  # or AsyncClient() if async
 
 http_client = httpx.Client(verify=False)
+async_http_client = httpx.AsyncClient(verify=False)
+
 
+DEFAULT_MODEL = "llama3-8b-8192"
 
+_llm_clients = {}
+_llm_lock = threading.Lock()
+_llm_factory = None
 
-CART_EXTRACTION_PROMPT = PromptTemplate.from_template("""
-You are an intelligent assistant that extracts food order items from customer messages.
 
-Given a menu and a user message, return a structured JSON list of the items the user wants to add to their cart. Each item should include the dish name and quantity.
+def set_llm_factory(factory: Optional[Callable[[float, str], object]]):
+    """Build LLM clients with `factory(temperature, model_name)` instead of ChatGroq (None restores it).
 
-### Menu:
+    Used by benchmark.py to swap in a local stand-in. Clears the client
+    registry; agents created earlier keep the client they already hold.
+    """
+    global _llm_factory
+    with _llm_lock:
+        _llm_factory = factory
+        _llm_clients.clear()
+
+
+def get_llm(temperature: float = 0.1, model_name: str = DEFAULT_MODEL) -> ChatGroq:
+    """Return the process-wide ChatGroq client for (model_name, temperature).
+
+    Clients are built once and share the http_client/async_http_client
+    connection pools, so tool calls don't pay for construction or new TLS handshakes.
+    """
+    key = (model_name, temperature)
+    llm = _llm_clients.get(key)
+    if llm is None:
+        with _llm_lock:
+            llm = _llm_clients.get(key)
+            if llm is None and _llm_factory is not None:
+                llm = _llm_clients[key] = _llm_factory(temperature, model_name)
+            elif llm is None:
+                llm = ChatGroq(
+                    temperature=temperature,
+                    groq_api_key=GROQ_API_KEY,
+                    model_name=model_name,
+                    http_client=http_client,
+                    http_async_client=async_http_client
+                )
+                _llm_clients[key] = llm
+    return llm
+
+
+
+CART_EXTRACTION_PROMPT = PromptTemplate.from_template("""Extract the menu items a customer wants to add to their cart.
+
+Menu (id: dish):
 {menu}
 
-### User message:
-{message}
+Recent conversation:
+{history}
 
-### JSON Output format:
-[
-  {{
-    "item": "<dish name from the menu>",
-    "quantity": <integer>
-  }},
-  ...
-]
+Customer message:
+{message}
 
-Only include items from the menu. If none match, return an empty list.
+Reply with only a JSON list of menu ids and quantities, e.g. [{{"id": 3, "quantity": 2}}]. Return [] if nothing matches.
 """)
+
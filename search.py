@@ -0,0 +1,272 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+
+import httpx
+
+from prompts import (SERP_TIMEOUT, SERP_CONNECT_TIMEOUT, SERP_MAX_RETRIES, SERP_MAX_CONNECTIONS,
+                     SERP_BREAKER_THRESHOLD, SERP_BREAKER_RESET, SEARCH_PROVIDER, SEARCH_FIXTURES_DIR,
+                     SEARCH_FIXTURE_LATENCY, SEARCH_FIXTURE_JITTER, SEARCH_FIXTURE_ERROR_RATE, SEARCH_FIXTURE_SEED)
+from utils import normalize
+
+SERP_API_URL = "https://serpapi.com/search"
+
+# Status codes worth retrying; everything else is returned (or raised) as-is
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is known to be failing"""
+
+
+class SearchRequestError(Exception):
+    """The upstream rejected the query itself (a 4xx such as "Unsupported location"); not an outage"""
+
+
+class SearchProvider:
+    """Backend for google_maps-style searches.
+
+    `search(params)` takes SerpAPI query parameters and returns the response
+    JSON (restaurants are read from its "local_results").
+    """
+
+    def search(self, params: dict) -> dict:
+        raise NotImplementedError
+
+    async def asearch(self, params: dict) -> dict:
+        raise NotImplementedError
+
+    def search_many(self, params_list: List[dict]) -> List[Union[dict, Exception]]:
+        """Run several searches concurrently; each slot holds the result or the error it raised"""
+        if len(params_list) <= 1:
+            return [self._capture(self.search, params) for params in params_list]
+        with ThreadPoolExecutor(max_workers=min(len(params_list), SERP_MAX_CONNECTIONS)) as pool:
+            return list(pool.map(lambda params: self._capture(self.search, params), params_list))
+
+    async def asearch_many(self, params_list: List[dict]) -> List[Union[dict, Exception]]:
+        """Async search_many: all queries share one round trip's worth of wall time"""
+        return await asyncio.gather(*(self.asearch(params) for params in params_list), return_exceptions=True)
+
+    @staticmethod
+    def _capture(search, params: dict) -> Union[dict, Exception]:
+        try:
+            return search(params)
+        except Exception as e:
+            return e
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failed calls in a row the circuit opens and
+    calls fail fast for `reset_timeout` seconds. The first call after that
+    is let through as a trial: success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                raise CircuitOpenError("SerpAPI circuit is open")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give up a half-open trial without a verdict, so the next call can try instead"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class SerpAPIClient(SearchProvider):
+    """Pooled, keep-alive SerpAPI client with timeouts, retries and a circuit breaker"""
+
+    def __init__(
+        self,
+        url: str = SERP_API_URL,
+        timeout: float = SERP_TIMEOUT,
+        connect_timeout: float = SERP_CONNECT_TIMEOUT,
+        max_retries: int = SERP_MAX_RETRIES,
+        backoff_base: float = 0.25,
+        backoff_max: float = 2.0,
+        breaker: CircuitBreaker = None,
+    ):
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker(SERP_BREAKER_THRESHOLD, SERP_BREAKER_RESET)
+        client_options = dict(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=SERP_MAX_CONNECTIONS, max_keepalive_connections=SERP_MAX_CONNECTIONS),
+        )
+        self._client = httpx.Client(**client_options)
+        self._async_client = httpx.AsyncClient(**client_options)
+
+    def search(self, params: dict) -> dict:
+        self.breaker.before_call()
+        try:
+            data = self._search(params)
+        except SearchRequestError:
+            # Bad input from one user says nothing about SerpAPI's health
+            self.breaker.release_trial()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Interrupted, not failed; don't leave a half-open trial claimed forever
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return data
+
+    async def asearch(self, params: dict) -> dict:
+        self.breaker.before_call()
+        try:
+            data = await self._asearch(params)
+        except SearchRequestError:
+            self.breaker.release_trial()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled, e.g. the client disconnected
+            self.breaker.release_trial()
+            raise
+        self.breaker.record_success()
+        return data
+
+    def _search(self, params: dict) -> dict:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._client.get(self.url, params=params)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return self._finish(response)
+                error = httpx.HTTPStatusError(f"SerpAPI returned {response.status_code}", request=response.request, response=response)
+            except httpx.TransportError as e:
+                error = e
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt))
+        raise error
+
+    async def _asearch(self, params: dict) -> dict:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._async_client.get(self.url, params=params)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return self._finish(response)
+                error = httpx.HTTPStatusError(f"SerpAPI returned {response.status_code}", request=response.request, response=response)
+            except httpx.TransportError as e:
+                error = e
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._backoff(attempt))
+        raise error
+
+    @staticmethod
+    def _finish(response: httpx.Response) -> dict:
+        if 400 <= response.status_code < 500:
+            raise SearchRequestError(f"SerpAPI rejected the query ({response.status_code}): {response.text[:200]}")
+        # A 5xx or a garbled body counts against the upstream
+        response.raise_for_status()
+        return response.json()
+
+    def _backoff(self, attempt: int) -> float:
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+class FixtureError(Exception):
+    """Injected failure from FixtureProvider"""
+
+
+class FixtureProvider(SearchProvider):
+    """Offline stand-in for SerpAPI that replays recorded responses.
+
+    Each JSON file in `directory` is a saved response (it needs at least
+    "local_results"). A query is answered by the file named after the whole
+    normalized query ("pizza restaurants in koramangala bengaluru india" ->
+    pizza_restaurants_in_koramangala_bengaluru_india.json), else by the one named
+    after its food type (pizza.json), else by default.json. Every call sleeps
+    `latency` +/- `jitter` seconds and fails with probability `error_rate`;
+    a fixed `seed` makes runs reproducible.
+    """
+
+    def __init__(self, directory: str = SEARCH_FIXTURES_DIR, latency: float = SEARCH_FIXTURE_LATENCY,
+                 jitter: float = SEARCH_FIXTURE_JITTER, error_rate: float = SEARCH_FIXTURE_ERROR_RATE,
+                 seed: Optional[int] = SEARCH_FIXTURE_SEED):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._fixtures = {}
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".json"):
+                with open(os.path.join(directory, filename)) as f:
+                    self._fixtures[filename[:-5]] = json.load(f)
+
+    def search(self, params: dict) -> dict:
+        delay, fail = self._draw()
+        time.sleep(delay)
+        return self._respond(params, fail)
+
+    async def asearch(self, params: dict) -> dict:
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        return self._respond(params, fail)
+
+    def _draw(self):
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            return delay, self._random.random() < self.error_rate
+
+    def _respond(self, params: dict, fail: bool) -> dict:
+        if fail:
+            raise FixtureError("Injected search failure")
+        query = normalize(params.get("q", ""))
+        food_type = query.split(" restaurants in ")[0]
+        for name in (query.replace(" ", "_"), food_type.replace(" ", "_"), "default"):
+            if name in self._fixtures:
+                return json.loads(json.dumps(self._fixtures[name]))
+        return {"local_results": []}
+
+
+def default_provider() -> SearchProvider:
+    if SEARCH_PROVIDER == "fixture":
+        return FixtureProvider(SEARCH_FIXTURES_DIR)
+    return SerpAPIClient()
+
+
+search_provider = default_provider()
@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from agent import FoodOrderingAgent
+from models import KnowledgeGraph
+
+
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "500"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+
+
+class SessionManager:
+    """Keeps one FoodOrderingAgent per chat session.
+
+    Agents are created lazily on first use and evicted when they have been idle
+    for longer than `ttl` seconds or when more than `max_sessions` are alive
+    (least recently used first), which caps the memory used per process.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = MAX_SESSIONS,
+        ttl: float = SESSION_TTL_SECONDS,
+        agent_factory: Optional[Callable[[KnowledgeGraph, str], FoodOrderingAgent]] = None,
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # All sessions share one knowledge graph so user history outlives a session
+        self.knowledge_graph = KnowledgeGraph()
+        self._agent_factory = agent_factory or (lambda kg, user_id: FoodOrderingAgent(knowledge_graph=kg, user_id=user_id))
+        self._sessions = OrderedDict()  # session_id -> (agent, last_seen)
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> FoodOrderingAgent:
+        """Return the agent for a session, creating it if needed"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            entry = self._sessions.pop(session_id, None)
+            agent = entry[0] if entry else self._agent_factory(self.knowledge_graph, self.user_id(session_id))
+            self._sessions[session_id] = (agent, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)[1][0].close()
+            return agent
+
+    @staticmethod
+    def user_id(session_id: str) -> str:
+        """Knowledge-graph user for a session; there are no logins, so each session is its own user"""
+        return f"session_{session_id}"
+
+    def drop(self, session_id: str):
+        """Forget a session (e.g. when the browser tab is closed)"""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry:
+            entry[0].close()
+
+    def _evict_expired(self, now: float):
+        # Entries are kept in last-used order, so expired ones are at the front
+        while self._sessions:
+            session_id, (_, last_seen) = next(iter(self._sessions.items()))
+            if now - last_seen <= self.ttl:
+                break
+            self._sessions.popitem(last=False)[1][0].close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -0,0 +1,390 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+KG_STORE = os.getenv("KG_STORE", "sqlite")  # "sqlite" or "memory"
+KG_DB_PATH = os.getenv("KG_DB_PATH", "knowledge_graph.db")
+
+
+class GraphStore:
+    """Storage backend for KnowledgeGraph.
+
+    Users are dicts shaped like `asdict(UserProfile)`; orders are the dicts
+    built by FoodOrderingAgent.process_order. `batch()` groups several writes
+    so they are committed together.
+    """
+
+    def save_user(self, user: dict):
+        raise NotImplementedError
+
+    def load_user(self, user_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def add_preferences(self, user_id: str, cuisine: str, restaurant: str):
+        raise NotImplementedError
+
+    def save_restaurant(self, restaurant: dict):
+        raise NotImplementedError
+
+    def save_order(self, order: dict):
+        raise NotImplementedError
+
+    def load_orders(self, user_id: Optional[str] = None, since: Optional[str] = None,
+                    limit: Optional[int] = None) -> List[dict]:
+        """Orders oldest first, optionally for one user and/or from an ISO timestamp on"""
+        raise NotImplementedError
+
+    def summarize_orders(self, user_id: Optional[str] = None, since: Optional[str] = None,
+                         until: Optional[str] = None, restaurants: int = 10, offset: int = 0,
+                         dishes: int = 15, users: int = 5) -> dict:
+        """Aggregated order counts for one page of the busiest restaurants.
+
+        Returns {"restaurants": [(name, orders)], "users": [(user_id, restaurant, orders)],
+        "dishes": [(restaurant, dish, quantity)]}, each sorted by weight. Only the
+        `users` most active users and `dishes` most ordered (restaurant, dish)
+        pairs among the page's restaurants are included, so the result size is
+        bounded by the arguments rather than by the order history.
+        """
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Everything in the store, for debugging only"""
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self):
+        yield
+
+
+class MemoryStore(GraphStore):
+    """Process-local dicts; nothing survives a restart"""
+
+    def __init__(self):
+        self.users = {}
+        self.restaurants = {}
+        self.orders = {}
+        self._lock = threading.RLock()
+
+    def save_user(self, user: dict):
+        with self._lock:
+            self.users[user["user_id"]] = json.loads(json.dumps(user))
+
+    def load_user(self, user_id: str) -> Optional[dict]:
+        with self._lock:
+            user = self.users.get(user_id)
+            return json.loads(json.dumps(user)) if user else None
+
+    def add_preferences(self, user_id: str, cuisine: str, restaurant: str):
+        with self._lock:
+            user = self.users.setdefault(user_id, {
+                "user_id": user_id, "preferred_cuisines": [], "favorite_restaurants": [],
+                "order_history": [], "location": "",
+            })
+            if cuisine not in user["preferred_cuisines"]:
+                user["preferred_cuisines"].append(cuisine)
+            if restaurant not in user["favorite_restaurants"]:
+                user["favorite_restaurants"].append(restaurant)
+
+    def save_restaurant(self, restaurant: dict):
+        with self._lock:
+            self.restaurants[restaurant["name"]] = dict(restaurant)
+
+    def save_order(self, order: dict):
+        with self._lock:
+            self.orders[order["order_id"]] = json.loads(json.dumps(order))
+
+    def load_orders(self, user_id=None, since=None, limit=None) -> List[dict]:
+        with self._lock:
+            orders = [o for o in self.orders.values()
+                      if (user_id is None or o["user_id"] == user_id) and (since is None or o["timestamp"] >= since)]
+        orders.sort(key=lambda o: o["timestamp"])
+        return orders[-limit:] if limit else orders
+
+    def summarize_orders(self, user_id=None, since=None, until=None, restaurants=10, offset=0,
+                         dishes=15, users=5) -> dict:
+        with self._lock:
+            orders = [o for o in self.orders.values()
+                      if (user_id is None or o["user_id"] == user_id)
+                      and (since is None or o["timestamp"] >= since)
+                      and (until is None or o["timestamp"] < until)]
+        by_restaurant = Counter(o["restaurant"] for o in orders)
+        page = sorted(by_restaurant.items(), key=lambda r: (-r[1], r[0]))[offset:offset + restaurants]
+        shown = {name for name, _ in page}
+        orders = [o for o in orders if o["restaurant"] in shown]
+
+        top_users = {uid for uid, _ in Counter(o["user_id"] for o in orders).most_common(users)}
+        user_edges = Counter((o["user_id"], o["restaurant"]) for o in orders if o["user_id"] in top_users)
+        dish_edges = Counter()
+        for o in orders:
+            for item in o["items"]:
+                dish_edges[(o["restaurant"], item["name"])] += item["quantity"]
+        return {
+            "restaurants": page,
+            "users": [(uid, rest, n) for (uid, rest), n in sorted(user_edges.items(), key=lambda e: (-e[1], e[0]))],
+            "dishes": [(rest, dish, q) for (rest, dish), q in sorted(dish_edges.items(), key=lambda e: (-e[1], e[0][1], e[0][0]))][:dishes],
+        }
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {"users": dict(self.users), "restaurants": dict(self.restaurants), "orders": dict(self.orders)}
+
+    @contextmanager
+    def batch(self):
+        with self._lock:
+            yield
+
+
+class SQLiteStore(GraphStore):
+    """SQLite backend shared by every worker that points at the same file.
+
+    Runs in WAL mode so readers never block the writer. Each thread gets its
+    own connection; writes are serialized per process and grouped into one
+    transaction per `batch()`.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        location TEXT NOT NULL DEFAULT ''
+    );
+    CREATE TABLE IF NOT EXISTS user_cuisines (
+        user_id TEXT NOT NULL,
+        cuisine TEXT NOT NULL,
+        added_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, cuisine)
+    );
+    CREATE TABLE IF NOT EXISTS user_restaurants (
+        user_id TEXT NOT NULL,
+        restaurant TEXT NOT NULL,
+        added_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, restaurant)
+    );
+    CREATE TABLE IF NOT EXISTS restaurants (
+        name TEXT PRIMARY KEY,
+        data TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS orders (
+        order_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        restaurant TEXT NOT NULL,
+        total REAL NOT NULL,
+        timestamp TEXT NOT NULL,
+        location TEXT NOT NULL DEFAULT ''
+    );
+    CREATE TABLE IF NOT EXISTS order_items (
+        order_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        price REAL NOT NULL,
+        PRIMARY KEY (order_id, position)
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_restaurants_restaurant ON user_restaurants (restaurant);
+    CREATE INDEX IF NOT EXISTS idx_orders_user_timestamp ON orders (user_id, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_orders_restaurant ON orders (restaurant);
+    CREATE INDEX IF NOT EXISTS idx_orders_timestamp ON orders (timestamp);
+    CREATE INDEX IF NOT EXISTS idx_order_items_name ON order_items (name);
+    """
+
+    def __init__(self, path: str = KG_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def batch(self):
+        conn = self._conn()
+        with self._write_lock:
+            outermost = self._local.depth == 0
+            if outermost:
+                conn.execute("BEGIN IMMEDIATE")
+            self._local.depth += 1
+            try:
+                yield conn
+            except BaseException:
+                self._local.depth -= 1
+                if outermost:
+                    conn.execute("ROLLBACK")
+                raise
+            self._local.depth -= 1
+            if outermost:
+                conn.execute("COMMIT")
+
+    def save_user(self, user: dict):
+        with self.batch() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, location) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET location = excluded.location",
+                (user["user_id"], user.get("location", "")),
+            )
+            conn.execute("DELETE FROM user_cuisines WHERE user_id = ?", (user["user_id"],))
+            conn.execute("DELETE FROM user_restaurants WHERE user_id = ?", (user["user_id"],))
+            conn.executemany(
+                "INSERT OR IGNORE INTO user_cuisines (user_id, cuisine, added_at) VALUES (?, ?, ?)",
+                [(user["user_id"], c, i) for i, c in enumerate(user.get("preferred_cuisines", []))],
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO user_restaurants (user_id, restaurant, added_at) VALUES (?, ?, ?)",
+                [(user["user_id"], r, i) for i, r in enumerate(user.get("favorite_restaurants", []))],
+            )
+
+    def load_user(self, user_id: str) -> Optional[dict]:
+        conn = self._conn()
+        row = conn.execute("SELECT location FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        cuisines = conn.execute(
+            "SELECT cuisine FROM user_cuisines WHERE user_id = ? ORDER BY added_at", (user_id,)
+        ).fetchall()
+        restaurants = conn.execute(
+            "SELECT restaurant FROM user_restaurants WHERE user_id = ? ORDER BY added_at", (user_id,)
+        ).fetchall()
+        return {
+            "user_id": user_id,
+            "preferred_cuisines": [c for (c,) in cuisines],
+            "favorite_restaurants": [r for (r,) in restaurants],
+            "order_history": [],
+            "location": row[0],
+        }
+
+    def add_preferences(self, user_id: str, cuisine: str, restaurant: str):
+        with self.batch() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (user_id) VALUES (?)", (user_id,))
+            conn.execute(
+                "INSERT OR IGNORE INTO user_cuisines (user_id, cuisine, added_at) "
+                "SELECT ?, ?, COALESCE(MAX(added_at), -1) + 1 FROM user_cuisines WHERE user_id = ?",
+                (user_id, cuisine, user_id),
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO user_restaurants (user_id, restaurant, added_at) "
+                "SELECT ?, ?, COALESCE(MAX(added_at), -1) + 1 FROM user_restaurants WHERE user_id = ?",
+                (user_id, restaurant, user_id),
+            )
+
+    def save_restaurant(self, restaurant: dict):
+        with self.batch() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO restaurants (name, data) VALUES (?, ?)",
+                (restaurant["name"], json.dumps(restaurant)),
+            )
+
+    def save_order(self, order: dict):
+        with self.batch() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO orders (order_id, user_id, restaurant, total, timestamp, location) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (order["order_id"], order["user_id"], order["restaurant"], order["total"],
+                 order["timestamp"], order.get("location", "")),
+            )
+            conn.execute("DELETE FROM order_items WHERE order_id = ?", (order["order_id"],))
+            conn.executemany(
+                "INSERT INTO order_items (order_id, position, name, quantity, price) VALUES (?, ?, ?, ?, ?)",
+                [(order["order_id"], i, item["name"], item["quantity"], item["price"])
+                 for i, item in enumerate(order["items"])],
+            )
+
+    def load_orders(self, user_id=None, since=None, limit=None) -> List[dict]:
+        conn = self._conn()
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        selected = "SELECT * FROM orders"
+        if clauses:
+            selected += " WHERE " + " AND ".join(clauses)
+        if limit:
+            # Newest `limit` orders; both queries below return them oldest first
+            selected += " ORDER BY timestamp DESC LIMIT ?"
+            params.append(limit)
+
+        orders = {}
+        for order_id, uid, restaurant, total, timestamp, location in conn.execute(
+            f"SELECT order_id, user_id, restaurant, total, timestamp, location FROM ({selected}) ORDER BY timestamp",
+            params,
+        ):
+            orders[order_id] = {
+                "order_id": order_id, "user_id": uid, "restaurant": restaurant, "items": [],
+                "total": total, "timestamp": timestamp, "location": location,
+            }
+        if orders:
+            for order_id, name, quantity, price in conn.execute(
+                f"SELECT i.order_id, i.name, i.quantity, i.price FROM order_items i "
+                f"JOIN ({selected}) o ON o.order_id = i.order_id ORDER BY i.order_id, i.position",
+                params,
+            ):
+                orders[order_id]["items"].append({"name": name, "quantity": quantity, "price": price})
+        return list(orders.values())
+
+    def summarize_orders(self, user_id=None, since=None, until=None, restaurants=10, offset=0,
+                         dishes=15, users=5) -> dict:
+        conn = self._conn()
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("o.user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            clauses.append("o.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("o.timestamp < ?")
+            params.append(until)
+        where = " AND ".join(clauses) or "1"
+
+        page = conn.execute(
+            f"SELECT o.restaurant, COUNT(*) AS n FROM orders o WHERE {where} "
+            f"GROUP BY o.restaurant ORDER BY n DESC, o.restaurant LIMIT ? OFFSET ?",
+            params + [restaurants, offset],
+        ).fetchall()
+        if not page:
+            return {"restaurants": [], "users": [], "dishes": []}
+
+        # Restrict the edge queries to the page's restaurants
+        where += f" AND o.restaurant IN ({','.join('?' * len(page))})"
+        params += [name for name, _ in page]
+        user_edges = conn.execute(
+            f"SELECT o.user_id, o.restaurant, COUNT(*) AS n FROM orders o "
+            f"JOIN (SELECT o.user_id FROM orders o WHERE {where} GROUP BY o.user_id "
+            f"      ORDER BY COUNT(*) DESC, o.user_id LIMIT ?) u ON u.user_id = o.user_id "
+            f"WHERE {where} GROUP BY o.user_id, o.restaurant ORDER BY n DESC, o.user_id, o.restaurant",
+            params + [users] + params,
+        ).fetchall()
+        dish_edges = conn.execute(
+            f"SELECT o.restaurant, i.name, SUM(i.quantity) AS q FROM order_items i "
+            f"JOIN orders o ON o.order_id = i.order_id WHERE {where} "
+            f"GROUP BY o.restaurant, i.name ORDER BY q DESC, i.name, o.restaurant LIMIT ?",
+            params + [dishes],
+        ).fetchall()
+        return {"restaurants": page, "users": user_edges, "dishes": dish_edges}
+
+    def snapshot(self) -> Dict[str, dict]:
+        conn = self._conn()
+        users = {uid: self.load_user(uid) for (uid,) in conn.execute("SELECT user_id FROM users").fetchall()}
+        restaurants = {name: json.loads(data) for name, data in conn.execute("SELECT name, data FROM restaurants")}
+        orders = {o["order_id"]: o for o in self.load_orders()}
+        return {"users": users, "restaurants": restaurants, "orders": orders}
+
+
+def default_store() -> GraphStore:
+    if KG_STORE == "memory":
+        return MemoryStore()
+    return SQLiteStore(KG_DB_PATH)
@@ -1,12 +1,51 @@
+import asyncio
 import json
+import logging
 import re
-import requests
-from typing import List, Type
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import AsyncIterator, List, Optional, Type, Union
 from pydantic import BaseModel, Field
 from langchain.tools import BaseTool
-from langchain_groq import ChatGroq
-from models import Restaurant
-from prompts import GROQ_API_KEY, SERP_API_KEY, http_client
+from cache import TTLCache, PersistentCache
+from menu import Menu, MenuStreamParser
+from models import MenuItem, Restaurant
+from prompts import (SERP_API_KEY, get_llm, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL,
+                     MENU_CACHE_PATH, MENU_CACHE_SIZE, MENU_CACHE_TTL, MENU_PREFETCH_QUEUE, MENU_PREFETCH_WORKERS,
+                     LOCATION_CACHE_PATH, LOCATION_CACHE_SIZE)
+import gazetteer
+from metrics import CACHE_LOOKUPS, FALLBACKS, STAGE_SECONDS, record_llm_usage, record_prompt, span
+from search import SearchRequestError, search_provider
+from utils import normalize
+
+
+logger = logging.getLogger(__name__)
+
+# normalized user message -> {"location", "ll"}
+_location_cache = PersistentCache(LOCATION_CACHE_PATH, "locations", maxsize=LOCATION_CACHE_SIZE)
+
+# (normalized location, normalized food type) -> List[Restaurant]
+_search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+# Results kept per search, and how far one message may fan out ("pizza or sushi in HSR or BTM")
+MAX_RESULTS = 5
+MAX_SEARCH_LOCATIONS = 3
+MAX_SEARCH_FOOD_TYPES = 3
+CHOICE_SEPARATORS = re.compile(r"\s*(?:,|;|/|\bor\b)\s*", re.IGNORECASE)
+# Commas are part of place names ("Koramangala, Bengaluru")
+PLACE_SEPARATORS = re.compile(r"\s*(?:;|/|\bor\b)\s*", re.IGNORECASE)
+
+MENU_UNAVAILABLE = "Sorry, I couldn't generate the menu at the moment. Please try again later."
+
+# "restaurant|cuisine" -> Menu.to_dict()
+_menu_store = PersistentCache(MENU_CACHE_PATH, "menus", maxsize=MENU_CACHE_SIZE, ttl=MENU_CACHE_TTL)
+
+def split_choices(message: str, separators: re.Pattern = CHOICE_SEPARATORS) -> List[str]:
+    """Split "pizza or sushi" / "pizza, sushi" into separate search terms"""
+    parts = [part.strip() for part in separators.split(message)]
+    return [part for part in parts if part] or [message.strip()]
+
 
 class LocationNormalizerInput(BaseModel):
     user_message: str = Field(description="User's raw location message")
@@ -17,7 +56,52 @@ class LocationNormalizerTool(BaseTool):
     args_schema: Type[BaseModel] = LocationNormalizerInput
 
     def _run(self, user_message: str) -> dict:
-        prompt = f"""
+        known = self._lookup(user_message)
+        if known is not None:
+            return known
+        with span("llm.location"):
+            response = get_llm(temperature=0.2).invoke(record_prompt(self._build_prompt(user_message), "location"))
+        record_llm_usage(response, "location")
+        return self._store_location(user_message, self._parse_response(response, user_message))
+
+    async def _arun(self, user_message: str) -> dict:
+        known = self._lookup(user_message)
+        if known is not None:
+            return known
+        with span("llm.location"):
+            response = await get_llm(temperature=0.2).ainvoke(record_prompt(self._build_prompt(user_message), "location"))
+        record_llm_usage(response, "location")
+        return self._store_location(user_message, self._parse_response(response, user_message))
+
+    def _run_many(self, places: List[str]) -> List[dict]:
+        """Normalize several locations at once; LLM calls for unknown ones overlap"""
+        if len(places) <= 1:
+            return [self._run(place) for place in places]
+        with ThreadPoolExecutor(max_workers=len(places)) as pool:
+            return list(pool.map(self._run, places))
+
+    async def _arun_many(self, places: List[str]) -> List[dict]:
+        return list(await asyncio.gather(*(self._arun(place) for place in places)))
+
+    def _lookup(self, user_message: str):
+        """Previously normalized input first, then the local gazetteer"""
+        cached = _location_cache.get(normalize(user_message))
+        if cached is not None:
+            CACHE_LOOKUPS.inc(cache="location", result="hit")
+            return cached
+        with span("gazetteer"):
+            place = gazetteer.lookup(user_message)
+        CACHE_LOOKUPS.inc(cache="location", result="gazetteer" if place else "miss")
+        return place
+
+    def _store_location(self, user_message: str, result: dict) -> dict:
+        # Only cache real answers; the title-cased fallback has no coordinates
+        if result.get("ll"):
+            _location_cache.set(normalize(user_message), result)
+        return result
+
+    def _build_prompt(self, user_message: str) -> str:
+        return f"""
     You are a helpful assistant that takes messy or informal location input and converts it into a clean, globally recognized location string.
     
     Respond ONLY with JSON in this format:
@@ -28,9 +112,8 @@ class LocationNormalizerTool(BaseTool):
     
     Input: "{user_message}"
     """
-        llm = ChatGroq(groq_api_key=GROQ_API_KEY, model_name="llama3-8b-8192", temperature=0.2,http_client=http_client)
-        response = llm.invoke(prompt)
-    
+
+    def _parse_response(self, response, user_message: str) -> dict:
         # ✅ Convert to plain string if needed
         if hasattr(response, "content"):
             response = response.content
@@ -39,12 +122,10 @@ class LocationNormalizerTool(BaseTool):
             json_str = re.search(r'\{.*\}', response, re.DOTALL).group()
             return json.loads(json_str)
         except Exception as e:
-            print(f"[LLM LocationNormalizer Error]: {e}")
+            logger.warning("location_unparsed message=%r error=%s", user_message, e)
+            FALLBACKS.inc(reason="location_unparsed")
             return {"location": user_message.title()}
 
-    def _arun(self, user_message: str):
-        raise NotImplementedError("Async not supported")
-
 
 
 class RestaurantSearchInput(BaseModel):
@@ -59,56 +140,163 @@ class RestaurantSearchTool(BaseTool):
     def _run(self, location: str, food_type: str = "") -> str:
         try:
             mock_restaurants = self._generate_restaurants(location, food_type)
-            if not mock_restaurants:
-                return f"❌ No '{food_type}' restaurants found near {location}."
-
-            result = f"🍽️ Top {min(3, len(mock_restaurants))} restaurants found for '{food_type}' in {location}:\n\n"
-            for i, r in enumerate(mock_restaurants[:3], 1):
-                stars = "⭐" * int(r.rating) if r.rating > 0 else "No rating"
-                result += f"{i}. **{r.name}**\n"
-                result += f"   📍 {r.address}\n"
-                result += f"   🍴 {r.cuisine_type}\n"
-                result += f"   {stars} ({r.rating}/5)\n\n"
-            return result
+            return self._format_results(mock_restaurants, location, food_type)
+        except Exception as e:
+            logger.warning("restaurant_search_failed location=%r food_type=%r error=%s", location, food_type, e)
+            return f"⚠️ Error searching for restaurants near {location}."
 
+    async def _arun(self, location: str, food_type: str = "") -> str:
+        try:
+            mock_restaurants = await self._agenerate_restaurants(location, food_type)
+            return self._format_results(mock_restaurants, location, food_type)
         except Exception as e:
-            print(f"[RestaurantSearch Error]: {e}")
+            logger.warning("restaurant_search_failed location=%r food_type=%r error=%s", location, food_type, e)
             return f"⚠️ Error searching for restaurants near {location}."
 
+    def _format_results(self, mock_restaurants: List[Restaurant], location: str, food_type: str) -> str:
+        if not mock_restaurants:
+            return f"❌ No '{food_type}' restaurants found near {location}."
+
+        result = f"🍽️ Top {min(3, len(mock_restaurants))} restaurants found for '{food_type}' in {location}:\n\n"
+        for i, r in enumerate(mock_restaurants[:3], 1):
+            stars = "⭐" * int(r.rating) if r.rating > 0 else "No rating"
+            result += f"{i}. **{r.name}**\n"
+            result += f"   📍 {r.address}\n"
+            result += f"   🍴 {r.cuisine_type}\n"
+            result += f"   {stars} ({r.rating}/5)\n\n"
+        return result
+
     def _generate_restaurants(self, location: str, food_type: str = "") -> List[Restaurant]:
+        key = self._cache_key(location, food_type)
+        cached = _search_cache.get(key)
+        if cached is not None:
+            CACHE_LOOKUPS.inc(cache="search", result="hit")
+            return list(cached)
+        CACHE_LOOKUPS.inc(cache="search", result="miss")
         try:
-            # Force usage of location string; lat/long often fails outside the US
-            query = f"{food_type} restaurants in {location}"
-            params = {
-                "engine": "google_maps",
-                "type": "search",
-                "q": query,
-                "location": location,
-                "api_key": SERP_API_KEY
-            }
-    
-            response = requests.get("https://serpapi.com/search", params=params)
-            data = response.json()
-    
-            results = []
-            for place in data.get("local_results", [])[:5]:
-                results.append(
-                    Restaurant(
-                        name=place.get("title", "Unknown"),
-                        address=place.get("address", "Unknown"),
-                        rating=float(place.get("rating", 0.0)),
-                        cuisine_type=food_type,
-                        phone=place.get("phone", "")
-                    )
-                )
-            return results
+            with span("search"):
+                data = search_provider.search(self._search_params(location, food_type))
+            return self._store_results(key, self._parse_results(data, food_type))
+        except SearchRequestError as e:
+            logger.info("search_rejected location=%r food_type=%r error=%s", location, food_type, e)
+            return []
         except Exception as e:
-            print("SerpAPI error:", e)
+            logger.warning("search_failed location=%r food_type=%r error=%s", location, food_type, e)
+            return self._stale_results(key)
+
+    async def _agenerate_restaurants(self, location: str, food_type: str = "") -> List[Restaurant]:
+        key = self._cache_key(location, food_type)
+        cached = _search_cache.get(key)
+        if cached is not None:
+            CACHE_LOOKUPS.inc(cache="search", result="hit")
+            return list(cached)
+        CACHE_LOOKUPS.inc(cache="search", result="miss")
+        try:
+            with span("search"):
+                data = await search_provider.asearch(self._search_params(location, food_type))
+            return self._store_results(key, self._parse_results(data, food_type))
+        except SearchRequestError as e:
+            logger.info("search_rejected location=%r food_type=%r error=%s", location, food_type, e)
             return []
+        except Exception as e:
+            logger.warning("search_failed location=%r food_type=%r error=%s", location, food_type, e)
+            return self._stale_results(key)
+
+    def _search_many(self, locations: List[str], food_types: List[str]) -> List[Restaurant]:
+        """Search every (location, food type) pair concurrently and merge the results"""
+        queries = self._queries(locations, food_types)
+        missing = [q for q, results in queries.items() if results is None]
+        with span("search_many"):
+            responses = search_provider.search_many([self._search_params(*q) for q in missing])
+        for query, data in zip(missing, responses):
+            queries[query] = self._query_results(query, data)
+        return self._merge(queries)
 
+    async def _asearch_many(self, locations: List[str], food_types: List[str]) -> List[Restaurant]:
+        queries = self._queries(locations, food_types)
+        missing = [q for q, results in queries.items() if results is None]
+        with span("search_many"):
+            responses = await search_provider.asearch_many([self._search_params(*q) for q in missing])
+        for query, data in zip(missing, responses):
+            queries[query] = self._query_results(query, data)
+        return self._merge(queries)
 
-    def _arun(self, location: str, food_type: str = ""):
-        raise NotImplementedError("Async not implemented")
+    def _queries(self, locations: List[str], food_types: List[str]) -> dict:
+        """(location, food type) -> cached results, or None where a search is needed"""
+        queries = {}
+        for location in locations[:MAX_SEARCH_LOCATIONS]:
+            for food_type in food_types[:MAX_SEARCH_FOOD_TYPES]:
+                cached = _search_cache.get(self._cache_key(location, food_type))
+                CACHE_LOOKUPS.inc(cache="search", result="miss" if cached is None else "hit")
+                queries[(location, food_type)] = list(cached) if cached is not None else None
+        return queries
+
+    def _query_results(self, query: tuple, data) -> List[Restaurant]:
+        key = self._cache_key(*query)
+        if isinstance(data, SearchRequestError):
+            logger.info("search_rejected location=%r food_type=%r error=%s", query[0], query[1], data)
+            return []
+        if isinstance(data, Exception):
+            logger.warning("search_failed location=%r food_type=%r error=%s", query[0], query[1], data)
+            return self._stale_results(key)
+        return self._store_results(key, self._parse_results(data, query[1]))
+
+    def _merge(self, queries: dict) -> List[Restaurant]:
+        """Dedupe by place id and rank: best position in any result list, then rating weighted by review count"""
+        best = {}
+        for results in queries.values():
+            for position, restaurant in enumerate(results):
+                key = restaurant.place_id or (normalize(restaurant.name), normalize(restaurant.address))
+                if key not in best or position < best[key][0]:
+                    best[key] = (position, restaurant)
+        ranked = sorted(best.values(), key=lambda entry: (entry[0], -self._weighted_rating(entry[1])))
+        return [restaurant for _, restaurant in ranked][:MAX_RESULTS]
+
+    def _weighted_rating(self, restaurant: Restaurant) -> float:
+        # Shrink ratings with few reviews towards a neutral prior
+        prior, weight = 3.5, 20
+        return (restaurant.rating * restaurant.reviews + prior * weight) / (restaurant.reviews + weight)
+
+    def _cache_key(self, location: str, food_type: str) -> tuple:
+        return normalize(location), normalize(food_type)
+
+    def _stale_results(self, key: tuple) -> List[Restaurant]:
+        # Upstream is failing (or the circuit is open): an expired answer beats none
+        FALLBACKS.inc(reason="search_stale")
+        return list(_search_cache.get_stale(key, ()))
+
+    def _store_results(self, key: tuple, results: List[Restaurant]) -> List[Restaurant]:
+        # Empty results usually mean a bad key or quota error; don't pin them
+        if results:
+            _search_cache.set(key, tuple(results))
+        return results
+
+    def _search_params(self, location: str, food_type: str) -> dict:
+        # Force usage of location string; lat/long often fails outside the US
+        query = f"{food_type} restaurants in {location}"
+        return {
+            "engine": "google_maps",
+            "type": "search",
+            "q": query,
+            "location": location,
+            "api_key": SERP_API_KEY
+        }
+
+    def _parse_results(self, data: dict, food_type: str) -> List[Restaurant]:
+        results = []
+        for place in data.get("local_results", [])[:MAX_RESULTS]:
+            results.append(
+                Restaurant(
+                    name=place.get("title", "Unknown"),
+                    address=place.get("address", "Unknown"),
+                    rating=float(place.get("rating", 0.0)),
+                    cuisine_type=food_type,
+                    phone=place.get("phone", ""),
+                    place_id=place.get("place_id", ""),
+                    reviews=int(place.get("reviews", 0) or 0),
+                )
+            )
+        return results
 
 
 
@@ -124,8 +312,102 @@ class MenuTool(BaseTool):
     args_schema: Type[BaseModel] = MenuInput
 
     def _run(self, restaurant_name: str, cuisine_type: str) -> str:
+        menu = self._get_menu(restaurant_name, cuisine_type)
+        return menu.text if menu is not None else MENU_UNAVAILABLE
+
+    async def _arun(self, restaurant_name: str, cuisine_type: str) -> str:
+        menu = await self._aget_menu(restaurant_name, cuisine_type)
+        return menu.text if menu is not None else MENU_UNAVAILABLE
+
+    def _get_menu(self, restaurant_name: str, cuisine_type: str) -> Optional[Menu]:
+        """Return the parsed menu, generating it with the LLM on a cache miss"""
+        cached = self._cached_menu(restaurant_name, cuisine_type)
+        if cached is not None:
+            return cached
+        prefetch = menu_prefetcher.pending(restaurant_name, cuisine_type)
+        if prefetch is not None:
+            try:
+                menu = prefetch.result()
+            except CancelledError:
+                menu = None  # dropped before it started
+            if menu is not None:
+                return menu
+        # No prefetch, or it failed: generate it here, like _aget_menu
+        return self._generate_menu(restaurant_name, cuisine_type)
+
+    def _generate_menu(self, restaurant_name: str, cuisine_type: str) -> Optional[Menu]:
+        try:
+            with span("llm.menu"):
+                result = get_llm(temperature=0.3).invoke(record_prompt(self._build_prompt(restaurant_name, cuisine_type), "menu"))
+            record_llm_usage(result, "menu")
+            return self._store_menu(restaurant_name, cuisine_type, result.content.strip())
+        except Exception as e:
+            logger.warning("menu_generation_failed restaurant=%r error=%s", restaurant_name, e)
+            return None
+
+    async def _aget_menu(self, restaurant_name: str, cuisine_type: str) -> Optional[Menu]:
+        cached = self._cached_menu(restaurant_name, cuisine_type)
+        if cached is not None:
+            return cached
+        menu = await menu_prefetcher.await_pending(restaurant_name, cuisine_type)
+        if menu is not None:
+            return menu
+        try:
+            with span("llm.menu"):
+                result = await get_llm(temperature=0.3).ainvoke(record_prompt(self._build_prompt(restaurant_name, cuisine_type), "menu"))
+            record_llm_usage(result, "menu")
+            return self._store_menu(restaurant_name, cuisine_type, result.content.strip())
+        except Exception as e:
+            logger.warning("menu_generation_failed restaurant=%r error=%s", restaurant_name, e)
+            return None
+
+    async def _astream_menu(self, restaurant_name: str, cuisine_type: str) -> AsyncIterator[Union[List[MenuItem], Menu, None]]:
+        """Stream menu generation: yields the items parsed so far each time a
+        line completes, then the finished Menu (None if generation failed).
+        A cached or prefetched menu is yielded as soon as it is ready.
+        """
+        cached = self._cached_menu(restaurant_name, cuisine_type)
+        if cached is not None:
+            yield cached
+            return
+        menu = await menu_prefetcher.await_pending(restaurant_name, cuisine_type)
+        if menu is not None:
+            yield menu
+            return
+        parser = MenuStreamParser()
+        started = time.perf_counter()
         try:
-            prompt = f"""
+            async for chunk in get_llm(temperature=0.3).astream(record_prompt(self._build_prompt(restaurant_name, cuisine_type), "menu")):
+                record_llm_usage(chunk, "menu")
+                if parser.feed(chunk.content):
+                    yield list(parser.items)
+            parser.close()
+            # Includes the time the consumer spent between chunks
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="llm.menu_stream")
+        except Exception as e:
+            logger.warning("menu_generation_failed restaurant=%r error=%s", restaurant_name, e)
+            yield None
+            return
+        yield self._store_menu(restaurant_name, cuisine_type, parser.raw_text.strip())
+
+    def _cached_menu(self, restaurant_name: str, cuisine_type: str) -> Optional[Menu]:
+        cached = _menu_store.get(self._cache_key(restaurant_name, cuisine_type))
+        CACHE_LOOKUPS.inc(cache="menu", result="miss" if cached is None else "hit")
+        return Menu.from_dict(restaurant_name, cached) if cached is not None else None
+
+    def _cache_key(self, restaurant_name: str, cuisine_type: str) -> str:
+        return f"{normalize(restaurant_name)}|{normalize(cuisine_type)}"
+
+    def _store_menu(self, restaurant_name: str, cuisine_type: str, raw_structured: str) -> Menu:
+        with span("parse.menu"):
+            menu = Menu.from_llm_text(restaurant_name, raw_structured)
+        # Only keep menus that parsed, so a malformed completion is retried next time
+        if menu.items:
+            _menu_store.set(self._cache_key(restaurant_name, cuisine_type), menu.to_dict())
+        return menu
+
+    def _build_prompt(self, restaurant_name: str, cuisine_type: str) -> str:
+        return f"""
                         You're an expert menu designer. Create a realistic and appealing menu for a restaurant named "{restaurant_name}".
                         Cuisine: {cuisine_type}
                         Generate 4–6 menu items. For each item, include:
@@ -142,52 +424,84 @@ class MenuTool(BaseTool):
                         Margherita Pizza | $12.99 | Main Course | Classic tomato, mozzarella, and basil on sourdough crust.
                         """
 
-            llm = ChatGroq(
-                temperature=0.3,
-                groq_api_key=GROQ_API_KEY,
-                model_name="llama3-8b-8192",
-                http_client=http_client
-            )
 
-            result = llm.invoke(prompt)
-            raw_structured = result.content.strip()
-            formatted = self._format_llm_menu(raw_structured, restaurant_name)
-            return formatted, raw_structured
+class MenuPrefetcher:
+    """Generates menus in the background for restaurants the user is looking at.
 
-        except Exception as e:
-            print(f"[MenuTool LLM Error]: {e}")
-            return "Sorry, I couldn't generate the menu at the moment. Please try again later."
+    Work is shared by every session: a menu already being generated is not
+    requested twice, and each requester holds a claim on it. `release` drops a
+    claim and cancels the job once nobody wants it and it has not started.
+    Finished menus land in the menu cache like any other.
+    """
 
+    def __init__(self, max_workers: int = MENU_PREFETCH_WORKERS, max_queued: int = MENU_PREFETCH_QUEUE):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="menu-prefetch")
+        # Jobs beyond the running ones are only speculation; past this many, new prefetches are skipped
+        self._max_jobs = max_workers + max_queued
+        self._jobs = {}  # cache key -> [future, claims]
+        # Reentrant: a future that is already done runs its callback (which locks) immediately
+        self._lock = threading.RLock()
 
-    def _format_llm_menu(self, raw_output: str, restaurant_name: str) -> str:
-        lines = [line.strip() for line in raw_output.strip().split("\n") if line.strip()]
-        result = f"🍽️ Menu for {restaurant_name}:\n\n"
-    
-        categories = {}
-        for line in lines:
-            # Skip header or lines that don't have exactly 4 parts
-            if line.lower().startswith("dish name") or line.count("|") != 3:
-                continue
-            try:
-                name, price, category, desc = [part.strip() for part in line.split("|")]
-                if category not in categories:
-                    categories[category] = []
-                categories[category].append((name, price, desc))
-            except Exception as e:
-                print("[Menu Parse Error]:", e, "Line:", line)
-    
-        for cat, items in categories.items():
-            result += f"📂 {cat}\n"
-            for name, price, desc in items:
-                result += f"   • {name} - {price}\n"
-                result += f"     {desc}\n\n"
-    
-        result += "💡 To add items to your cart, say something like:\n"
-        result += "   'Add 2 Margherita Pizza' or 'I want the Caesar Salad'"
-        return result
+    def prefetch(self, restaurant_name: str, cuisine_type: str) -> Optional[str]:
+        """Start generating a menu unless it is cached; returns the key to release, if claimed"""
+        key = MenuTool()._cache_key(restaurant_name, cuisine_type)
+        if _menu_store.get(key) is not None:
+            return None
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                if len(self._jobs) >= self._max_jobs:
+                    logger.debug("menu_prefetch_skipped restaurant=%r queued=%d", restaurant_name, len(self._jobs))
+                    return None
+                future = self._pool.submit(MenuTool()._generate_menu, restaurant_name, cuisine_type)
+                job = self._jobs[key] = [future, 0]
+                future.add_done_callback(lambda f: self._done(key, f))
+            job[1] += 1
+        return key
 
+    def release(self, key: str):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            job[1] -= 1
+            unclaimed = job[1] <= 0
+        if unclaimed:
+            job[0].cancel()
 
+    def pending(self, restaurant_name: str, cuisine_type: str) -> Optional[Future]:
+        """The prefetch for a menu the user actually picked, if it is already running.
 
+        A job still waiting in the queue may sit behind other sessions'
+        speculative work, so it is cancelled instead and the caller generates
+        (or streams) the menu itself right away.
+        """
+        with self._lock:
+            job = self._jobs.get(MenuTool()._cache_key(restaurant_name, cuisine_type))
+        if job is None or job[0].cancel() or job[0].cancelled():
+            CACHE_LOOKUPS.inc(cache="menu_prefetch", result="miss")
+            return None
+        CACHE_LOOKUPS.inc(cache="menu_prefetch", result="hit")
+        return job[0]
+
+    async def await_pending(self, restaurant_name: str, cuisine_type: str) -> Optional[Menu]:
+        """The prefetched menu if one is in flight, without blocking the event loop"""
+        future = self.pending(restaurant_name, cuisine_type)
+        if future is None:
+            return None
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return None  # the prefetch was dropped, not this task
+            raise
+        except Exception:
+            return None
 
+    def _done(self, key: str, future: Future):
+        with self._lock:
+            if self._jobs.get(key, [None])[0] is future:
+                del self._jobs[key]
 
 
+menu_prefetcher = MenuPrefetcher()
@@ -1,13 +1,22 @@
+import asyncio
 import unicodedata
 import re
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+import numpy as np
 import networkx as nx
-import matplotlib.pyplot as plt
+from concurrent.futures import Future, ThreadPoolExecutor
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from io import BytesIO
 from PIL import Image
-from models import UserProfile
+from cache import TTLCache
+from prompts import KG_RENDER_TTL, KG_RENDER_WORKERS
 
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
     from agent import FoodOrderingAgent
@@ -21,47 +30,204 @@ def normalize(text):
     text = re.sub(r"\s+", " ", text)  # normalize spaces
     return text.strip()
 
-def render_knowledge_graph(agent) -> Image.Image:
-    G = nx.DiGraph()
-
-    # Add user node
-    user_id = agent.current_user_id
-    G.add_node(user_id, label="User", color="skyblue")
-
-    # Add favorite restaurants and cuisines
-    user = agent.knowledge_graph.get_user(user_id)
-    if user:
-        for cuisine in user.preferred_cuisines:
-            G.add_node(cuisine, label="Cuisine", color="orange")
-            G.add_edge(user_id, cuisine, label="likes cuisine")
-        
-        for rest in user.favorite_restaurants:
-            G.add_node(rest, label="Restaurant", color="lightgreen")
-            G.add_edge(user_id, rest, label="likes restaurant")
-
-    # Add past orders
-    for order_id, order in agent.knowledge_graph.orders.items():
-        G.add_node(order_id, label="Order", color="gray")
-        G.add_edge(user_id, order_id, label="placed")
-
-        G.add_node(order["restaurant"], label="Restaurant", color="lightgreen")
-        G.add_edge(order_id, order["restaurant"], label="from")
-
-        for item in order["items"]:
-            item_name = item["name"]
-            G.add_node(item_name, label="Dish", color="pink")
-            G.add_edge(order_id, item_name, label=f"{item['quantity']}x")
-
-    pos = nx.spring_layout(G, seed=42)
-    node_colors = [G.nodes[n].get("color", "white") for n in G.nodes()]
-
-    plt.figure(figsize=(10, 6))
-    nx.draw(G, pos, with_labels=True, node_color=node_colors, node_size=1000, font_size=8)
-    nx.draw_networkx_edge_labels(G, pos, edge_labels={(u, v): d["label"] for u, v, d in G.edges(data=True)})
-
-    # Save to image
-    buf = BytesIO()
-    plt.savefig(buf, format='png')
-    plt.close()
-    buf.seek(0)
-    return Image.open(buf)
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (~4 characters per token), good enough for budgeting"""
+    return (len(text) + 3) // 4
+
+RENDER_FORMATS = ("png", "svg", "json")
+
+# Rendering is CPU-bound; a small pool keeps a burst of graph requests from starving chat turns
+_render_pool = ThreadPoolExecutor(max_workers=KG_RENDER_WORKERS, thread_name_prefix="kg-render")
+
+
+@dataclass(frozen=True)
+class GraphScope:
+    """Which slice of the order history to draw.
+
+    `since`/`until` are ISO timestamps (or dates); `page` steps through the
+    restaurants `restaurants` at a time, busiest first.
+    """
+    user_id: Optional[str] = None
+    since: Optional[str] = None
+    until: Optional[str] = None
+    restaurants: int = 10
+    page: int = 0
+    dishes: int = 15
+    users: int = 5
+
+
+class KnowledgeGraphView:
+    """Renders scoped, aggregated views of a KnowledgeGraph.
+
+    Orders are aggregated by the store into weighted user -> restaurant and
+    restaurant -> dish edges, so drawing cost depends on the scope, not on the
+    size of the history. Node positions are remembered across renders and
+    used to warm-start the spring layout, whose iteration count is bounded by
+    `layout_budget` seconds.
+    """
+
+    MAX_POSITIONS = 4096
+
+    def __init__(self, knowledge_graph, layout_budget: float = 1.0, cache_size: int = 32, ttl: float = KG_RENDER_TTL):
+        self.layout_budget = layout_budget
+        self._knowledge_graph = knowledge_graph
+        self._lock = threading.RLock()
+        self._layout_lock = threading.Lock()
+        self._pos = {}
+        self._seconds_per_iteration = None
+        # The version key catches this process's writes; the TTL bounds how long other workers' go unseen
+        self._renders = TTLCache(maxsize=cache_size, ttl=ttl)
+        self._in_flight = {}
+
+    def build_graph(self, scope: GraphScope) -> nx.DiGraph:
+        kg = self._knowledge_graph
+        summary = kg.summarize_orders(
+            user_id=scope.user_id, since=scope.since, until=scope.until, restaurants=scope.restaurants,
+            offset=scope.page * scope.restaurants, dishes=scope.dishes, users=scope.users,
+        )
+        G = nx.DiGraph()
+        shown = {name for name, _ in summary["restaurants"]}
+        for name, count in summary["restaurants"]:
+            G.add_node(name, label="Restaurant", color="lightgreen", weight=count)
+
+        user_ids = {uid for uid, _, _ in summary["users"]}
+        if scope.user_id:
+            user_ids.add(scope.user_id)
+        for uid in user_ids:
+            G.add_node(uid, label="User", color="skyblue")
+            user = kg.get_user(uid)
+            if user is None:
+                continue
+            for cuisine in user.preferred_cuisines:
+                G.add_node(cuisine, label="Cuisine", color="orange")
+                G.add_edge(uid, cuisine, label="likes cuisine", weight=1)
+            for rest in user.favorite_restaurants:
+                if rest in shown:
+                    G.add_edge(uid, rest, label="likes restaurant", weight=1)
+
+        for uid, rest, count in summary["users"]:
+            G.add_edge(uid, rest, label=f"{count} order{'s' if count != 1 else ''}", weight=count)
+        for rest, dish, quantity in summary["dishes"]:
+            G.add_node(dish, label="Dish", color="pink")
+            G.add_edge(rest, dish, label=f"{quantity}x", weight=quantity)
+        return G
+
+    def layout(self, G: nx.DiGraph) -> dict:
+        with self._layout_lock:
+            # Warm start: known nodes keep their place, new ones start next to a neighbour
+            initial = {}
+            for node in G:
+                if node in self._pos:
+                    initial[node] = self._pos[node]
+                else:
+                    placed = [self._pos[n] for n in nx.all_neighbors(G, node) if n in self._pos]
+                    if placed:
+                        initial[node] = placed[0] + np.random.default_rng(len(initial)).normal(0, 0.05, 2)
+            iterations = 15 if len(initial) == len(G) else 50
+            if self._seconds_per_iteration:
+                iterations = max(3, min(iterations, int(self.layout_budget / self._seconds_per_iteration)))
+
+            started = time.perf_counter()
+            pos = nx.spring_layout(G, pos=initial or None, iterations=iterations, seed=42) if len(G) else {}
+            self._seconds_per_iteration = (time.perf_counter() - started) / iterations
+            if len(self._pos) > self.MAX_POSITIONS:
+                self._pos = {}
+            self._pos.update(pos)
+            return pos
+
+    def to_json(self, G: nx.DiGraph, pos: dict) -> dict:
+        """Nodes with positions and weighted edges, for drawing the graph client-side"""
+        return {
+            "nodes": [{"id": n, "x": float(pos[n][0]), "y": float(pos[n][1]), **d} for n, d in G.nodes(data=True)],
+            "edges": [{"source": u, "target": v, **d} for u, v, d in G.edges(data=True)],
+        }
+
+    def draw(self, G: nx.DiGraph, pos: dict, fmt: str = "png") -> bytes:
+        # A private Figure on the Agg canvas: no pyplot global state, safe to run in parallel
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        node_colors = [G.nodes[n].get("color", "white") for n in G.nodes()]
+        weights = [d["weight"] for _, _, d in G.edges(data=True)]
+        widths = [1 + 3 * w / max(weights) for w in weights]
+
+        nx.draw(G, pos, ax=ax, with_labels=True, node_color=node_colors, node_size=1000, font_size=8, width=widths)
+        nx.draw_networkx_edge_labels(G, pos, ax=ax, edge_labels={(u, v): d["label"] for u, v, d in G.edges(data=True)})
+
+        buf = BytesIO()
+        fig.savefig(buf, format=fmt)
+        return buf.getvalue()
+
+    def _render(self, scope: GraphScope, fmt: str):
+        G = self.build_graph(scope)
+        pos = self.layout(G)
+        if fmt == "json":
+            return self.to_json(G, pos)
+        return self.draw(G, pos, fmt)
+
+    def render(self, scope: GraphScope, fmt: str = "png") -> Future:
+        """Future for the scope rendered as "png" or "svg" bytes, or a "json" dict.
+
+        Results are memoized per (scope, format, graph version) for up to
+        `ttl` seconds; concurrent requests for the same key share one render,
+        and drawing runs on the bounded render pool.
+        """
+        if fmt not in RENDER_FORMATS:
+            raise ValueError(f"Unsupported knowledge graph format: {fmt}")
+        key = (scope, fmt, self._knowledge_graph.version)
+        with self._lock:
+            cached = self._renders.get(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = _render_pool.submit(self._render, scope, fmt)
+                future.add_done_callback(lambda f: self._finish(key, f))
+            return future
+
+    def _finish(self, key, future: Future):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if not future.cancelled() and future.exception() is None:
+                self._renders.set(key, future.result())
+
+
+# One view per KnowledgeGraph, dropped together with it
+_graph_views = weakref.WeakKeyDictionary()
+_graph_views_lock = threading.Lock()
+
+
+def get_graph_view(knowledge_graph) -> KnowledgeGraphView:
+    with _graph_views_lock:
+        view = _graph_views.get(knowledge_graph)
+        if view is None:
+            view = _graph_views[knowledge_graph] = KnowledgeGraphView(knowledge_graph)
+        return view
+
+
+def render_knowledge_graph(agent, scope: Optional[GraphScope] = None, fmt: str = "png"):
+    """Draw the agent's user's slice of the knowledge graph, or `scope` if given.
+
+    Returns a PIL image for "png", SVG markup for "svg" and a node/edge dict for "json".
+    """
+    view = get_graph_view(agent.knowledge_graph)
+    return _decode(view.render(scope or GraphScope(user_id=agent.current_user_id), fmt).result(), fmt)
+
+
+async def arender_knowledge_graph(agent, scope: Optional[GraphScope] = None, fmt: str = "png"):
+    """Async render_knowledge_graph; waits for the render pool without blocking the event loop"""
+    view = get_graph_view(agent.knowledge_graph)
+    future = view.render(scope or GraphScope(user_id=agent.current_user_id), fmt)
+    # The future is shared with other waiters; one of them being cancelled must not cancel the render
+    return _decode(await asyncio.shield(asyncio.wrap_future(future)), fmt)
+
+
+def _decode(result, fmt: str):
+    if fmt == "png":
+        return Image.open(BytesIO(result))
+    if fmt == "svg":
+        return result.decode("utf-8")
+    return result